@@ -0,0 +1,407 @@
+"""Answers for the foreign-aid section of the dashboard.
+
+``FrameAidData`` computes every chart from the full disbursement frame held in
+memory. ``PushdownAidData`` asks BigQuery for each chart's aggregate instead,
+keeping only small results in a bounded LRU cache, so memory per replica no
+longer grows with ``trunc3``. Its cache is dropped whenever ``trunc3`` changes,
+or after ``max_age`` if that can't be checked. Both take ``"All"`` as the
+wildcard selection.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from filter_index import ALL, FilterIndex, SortIndex
+from prepare import dataset_stamp
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+AMOUNT = "Current_Dollar_Amount"
+SORT_VARIABLES = ["Foreign_Assistance_Objective_Name", "International_Purpose_Name"]
+PAGE_SIZE = int(os.environ.get("DASHBOARD_DETAIL_PAGE_SIZE", 500))
+# columns of the detail table, which can be sorted by any of them
+DETAIL_SORT_COLUMNS = [
+    "Fiscal_Year",
+    "Current_Dollar_Amount",
+    "Activity_Name",
+    "Activity_Description",
+    "Funding_Agency_Name",
+    "Foreign_Assistance_Objective_Name",
+    "International_Purpose_Name",
+    "International_Category_Name",
+    "International_Sector_Name",
+]
+DETAIL_CACHE_SIZE = 32
+TOP_ACTIVITIES = 10  # depth of the precomputed top-activities tables
+ACTIVITY = ["Activity_Name", "Activity_Description"]
+
+CUBE_DIMENSIONS = [
+    "Country_Name",
+    "Fiscal_Year",
+    "Funding_Agency_Name",
+    "Foreign_Assistance_Objective_Name",
+    "International_Purpose_Name",
+]
+MAX_CUBE_CELLS = int(os.environ.get("DASHBOARD_MAX_CUBE_CELLS", 20_000_000))
+
+
+class AidCube:
+    """Dense country x year x agency x objective x purpose array of summed aid.
+
+    A parallel array of row counts tells an empty combination apart from one
+    that sums to zero, so the charts list exactly the groups pandas would.
+    """
+
+    def __init__(self, labels, sums, counts):
+        self.labels = labels  # dimension -> pd.Index of its values, in axis order
+        self.sums = sums
+        self.counts = counts
+
+    @classmethod
+    def build(cls, df, max_cells=MAX_CUBE_CELLS):
+        """Aggregate ``df`` in one pass, or return None if the cube would exceed ``max_cells``."""
+        codes, labels = [], {}
+        for dim in CUBE_DIMENSIONS:
+            # missing values get their own slot so the "All" totals still include those rows
+            dim_codes, uniques = pd.factorize(df[dim], sort=True, use_na_sentinel=False)
+            codes.append(dim_codes)
+            labels[dim] = pd.Index(uniques)
+        shape = tuple(len(labels[dim]) for dim in CUBE_DIMENSIONS)
+        size = int(np.prod(shape, dtype=np.int64))
+        if size > max_cells:
+            return None
+        flat = np.ravel_multi_index(codes, shape) if len(df) else np.zeros(0, dtype=np.intp)
+        amounts = df[AMOUNT].to_numpy(dtype=float, na_value=0.0)
+        sums = np.bincount(flat, weights=amounts, minlength=size).reshape(shape)
+        counts = np.bincount(flat, minlength=size).astype(np.int32).reshape(shape)
+        return cls(labels, sums, counts)
+
+    def _index(self, selection):
+        index = []
+        for dim in CUBE_DIMENSIONS:
+            value = selection.get(dim, ALL)
+            if isinstance(value, str) and value == ALL:
+                index.append(slice(None))
+                continue
+            labels = self.labels[dim]
+            if value not in labels:
+                return None
+            position = labels.get_loc(value)
+            index.append(slice(position, position + 1))  # a range keeps the axis, so shapes line up
+        return tuple(index)
+
+    def total(self, **selection):
+        index = self._index(selection)
+        return 0.0 if index is None else self.sums[index].sum()
+
+    def rollup(self, keep, **selection):
+        """Sum out every dimension but ``keep``, returning one row per non-empty group."""
+        index = self._index(selection)
+        if index is None:
+            return pd.DataFrame(columns=[*keep, AMOUNT])
+        axes = [CUBE_DIMENSIONS.index(dim) for dim in keep]
+        summed = tuple(axis for axis in range(len(CUBE_DIMENSIONS)) if axis not in axes)
+        sums = self.sums[index].sum(axis=summed)
+        positions = np.nonzero(self.counts[index].sum(axis=summed))
+        result = pd.DataFrame({
+            dim: self.labels[dim][index[axis]][pos]
+            for dim, axis, pos in zip(keep, axes, positions)
+        })
+        result[AMOUNT] = sums[positions]
+        # groupby drops missing keys, so the cube's NaN slots stay out of the charts
+        return result.dropna(subset=list(keep)).reset_index(drop=True)
+
+
+class FrameAidData:
+    def __init__(self, df):
+        self.df = df
+        self.version, self.fetched_at = dataset_stamp(df)
+        self.index = FilterIndex(df, ["Country_Name", "Fiscal_Year", "Funding_Agency_Name"])
+        self.cube = AidCube.build(df)  # None falls back to grouping df on every call
+        self.sort_index = SortIndex(df)
+        self.top = self._top_activities_table(TOP_ACTIVITIES)
+        self._detail_rows = OrderedDict()  # (filters, sort) -> ordered positions, so paging doesn't refilter
+        self._lock = threading.Lock()
+
+    # missing values are never offered as choices, as in the pushdown queries
+    def countries(self):
+        return sorted(self.df["Country_Name"].dropna().unique())
+
+    def years(self):
+        return sorted(self.df["Fiscal_Year"].dropna().unique(), reverse=True)
+
+    def agencies(self):
+        return sorted(self.df["Funding_Agency_Name"].dropna().unique())
+
+    def _filter(self, country=ALL, year=ALL, agency=ALL):
+        return self.index.select(Country_Name=country, Fiscal_Year=year, Funding_Agency_Name=agency)
+
+    def total(self, country, year, agency):
+        if self.cube is not None:
+            return self.cube.total(Country_Name=country, Fiscal_Year=year, Funding_Agency_Name=agency)
+        return self._filter(country, year, agency)[AMOUNT].sum()
+
+    def timeline(self, country, agency):
+        if self.cube is not None:
+            return self.cube.rollup(["Country_Name", "Fiscal_Year"], Country_Name=country, Funding_Agency_Name=agency)
+        return self._filter(country, ALL, agency).groupby(["Country_Name", "Fiscal_Year"], as_index=False, observed=True).agg(
+            {AMOUNT: "sum"}
+        )
+
+    def breakdown(self, country, year, sort_variable):
+        if self.cube is not None:
+            return self.cube.rollup([sort_variable], Country_Name=country, Fiscal_Year=year).sort_values(
+                by=AMOUNT, ascending=True
+            )
+        return self._filter(country, year).groupby(sort_variable, as_index=False, observed=True).agg(
+            {AMOUNT: "sum"}
+        ).sort_values(by=AMOUNT, ascending=True)
+
+    def _top_activities_table(self, k):
+        """Positions of the ``k`` largest activities for every (country, year) selection, "All" included.
+
+        Returns selection -> (frame, positions), so a lookup is one ``take`` of at most ``k`` rows.
+        """
+        keys = ["Country_Name", "Fiscal_Year", *ACTIVITY]
+        # one grouping of the long text columns (as category codes); the slices below only re-sum these sums.
+        # missing countries and years still count towards "All", missing activities never show up
+        sums = self.df.groupby(keys, observed=True, dropna=False)[AMOUNT].sum().reset_index()
+        sums = sums[sums[ACTIVITY].notna().all(axis=1)]
+        table = {}
+        for by in ([], ["Country_Name"], ["Fiscal_Year"], ["Country_Name", "Fiscal_Year"]):
+            totals = sums.groupby([*by, *ACTIVITY], observed=True, dropna=False)[AMOUNT].sum().reset_index()
+            if not by:
+                top = totals.nlargest(k, AMOUNT)[[*ACTIVITY, AMOUNT]].reset_index(drop=True)
+                table[ALL, ALL] = (top, np.arange(len(top)))
+                continue
+            # largest first within each slice (stable, so ties keep grouping order), then the first k of each
+            totals = totals.sort_values(AMOUNT, ascending=False, kind="stable")
+            totals = totals[totals.groupby(by, observed=True).cumcount().to_numpy() < k]
+            frame = totals[[*ACTIVITY, AMOUNT]].reset_index(drop=True)
+            for selection, positions in totals.groupby(by, observed=True).indices.items():
+                selection = dict(zip(by, selection if isinstance(selection, tuple) else (selection,)))
+                table[selection.get("Country_Name", ALL), selection.get("Fiscal_Year", ALL)] = (frame, positions)
+        self._empty_top = table[ALL, ALL][0].iloc[:0]
+        return table
+
+    def top_activities(self, country, year, n=10):
+        if n <= TOP_ACTIVITIES:
+            entry = self.top.get((country, year))
+            if entry is None:
+                return self._empty_top
+            frame, positions = entry
+            return frame.take(positions[:n])
+        return self._filter(country, year).groupby(ACTIVITY, as_index=False, observed=True).agg(
+            {AMOUNT: "sum"}
+        ).sort_values(by=AMOUNT, ascending=False).head(n)
+
+    def _ordered_rows(self, country, year, agency, sort, descending):
+        key = (country, year, agency, sort, descending)
+        with self._lock:
+            if key in self._detail_rows:
+                self._detail_rows.move_to_end(key)
+                return self._detail_rows[key]
+        rows = self.index.rows(Country_Name=country, Fiscal_Year=year, Funding_Agency_Name=agency)
+        if sort is not None:
+            rows = self.sort_index.order(rows, sort, descending)
+        with self._lock:
+            self._detail_rows[key] = rows
+            while len(self._detail_rows) > DETAIL_CACHE_SIZE:
+                self._detail_rows.popitem(last=False)
+        return rows
+
+    def detail(self, country, year, agency, page=1, sort=None, descending=False):
+        """One ``PAGE_SIZE`` page of the matching rows, optionally ordered by ``sort``."""
+        if sort is not None and sort not in DETAIL_SORT_COLUMNS:
+            raise ValueError(f"cannot sort the detail table by {sort!r}")
+        rows = self._ordered_rows(country, year, agency, sort, descending)
+        start = (page - 1) * PAGE_SIZE
+        if rows is None:  # unfiltered and unsorted: the page is a plain range
+            positions = np.arange(start, min(start + PAGE_SIZE, len(self.df)))
+        else:
+            positions = rows[start:start + PAGE_SIZE]
+        return self.df.take(positions).drop(columns=["Country_Name"])
+
+    def detail_rows(self, country, year, agency):
+        rows = self.index.rows(Country_Name=country, Fiscal_Year=year, Funding_Agency_Name=agency)
+        return len(self.df) if rows is None else len(rows)
+
+
+AID_TABLE = "`data342.israel.trunc3`"
+# same rename the in-memory path applies after loading
+COUNTRY_SQL = 'IF(Country_Name = "West Bank and Gaza", "Palestine", Country_Name)'
+DETAIL_COLUMNS = """Fiscal_Year, Current_Dollar_Amount, Activity_Name, Activity_Description,
+Funding_Agency_Name, Foreign_Assistance_Objective_Name, International_Purpose_Name,
+International_Category_Name, International_Sector_Name"""
+# appended to the detail table's sort key: tied rows have no order in BigQuery, so without
+# it separate page queries could repeat or skip rows. Rows equal in every column look the
+# same on whichever page they land
+DETAIL_TIEBREAK = ", ".join(f"{column.strip()} ASC NULLS LAST" for column in DETAIL_COLUMNS.split(","))
+PUSHDOWN_CACHE_SIZE = int(os.environ.get("DASHBOARD_PUSHDOWN_CACHE_SIZE", 256))
+# seconds between checks of trunc3's modification time
+PUSHDOWN_CHECK_EVERY = float(os.environ.get("DASHBOARD_PUSHDOWN_CHECK_EVERY", 300))
+
+
+class PushdownAidData:
+    """Runs one parameterized query per chart through ``run(sql, params)``.
+
+    ``versions()`` reports what ``trunc3`` currently is (see sources.py).
+    ``check_version`` drops every cached result once that changes, or every
+    ``max_age`` seconds when there is no way to tell.
+    """
+
+    def __init__(self, run, maxsize=PUSHDOWN_CACHE_SIZE, versions=None, max_age=24 * 60 * 60,
+                 check_every=PUSHDOWN_CHECK_EVERY):
+        self.run = run
+        self.maxsize = maxsize
+        self.versions = versions
+        self.max_age = max_age
+        self.check_every = check_every
+        self.version = time.time_ns()  # a dataset_stamp version of its own, renewed whenever the cache is dropped
+        self.hits = self.misses = 0
+        self.flight = SingleFlight()  # sessions missing on the same query share one run
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._seen = None  # what versions() (or the max_age period) said when the cache was last dropped
+        self._checked_at = None
+
+    def check_version(self):
+        """Drop the cached results if ``trunc3`` changed; checked at most every ``check_every`` seconds."""
+        now = time.time()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_every:
+                return
+            self._checked_at = now
+        seen = None
+        if self.versions is not None:
+            try:
+                seen = self.versions()
+            except Exception:
+                logger.warning("could not check trunc3, expiring pushdown results by age", exc_info=True)
+        if seen is None:
+            seen = ("age", int(now // self.max_age))
+        with self._lock:
+            if seen == self._seen:
+                return
+            if self._seen is not None:
+                logger.info("trunc3 changed, dropping %d cached pushdown results", len(self._cache))
+                self._cache.clear()
+                self.version = time.time_ns()
+            self._seen = seen
+
+    def _query(self, sql, params=None):
+        key = (sql, tuple(sorted((params or {}).items())))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+        return self.flight.do(key, lambda: self._run(key, sql, params))
+
+    def _run(self, key, sql, params):
+        result = self.run(sql, params or {})
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = result
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return result
+
+    def _where(self, country=ALL, year=ALL, agency=ALL):
+        # only bind the filters that are set, so BigQuery can type-check every parameter
+        clauses = ['Transaction_Type_Name = "Disbursements"']
+        params = {}
+        if country != ALL:
+            clauses.append(f"{COUNTRY_SQL} = @country")
+            params["country"] = country
+        if year != ALL:
+            clauses.append("Fiscal_Year = @year")
+            params["year"] = year.item() if isinstance(year, np.generic) else year
+        if agency != ALL:
+            clauses.append("Funding_Agency_Name = @agency")
+            params["agency"] = agency
+        return " AND ".join(clauses), params
+
+    def _distinct(self, expression, descending=False):
+        sql = f"""
+SELECT DISTINCT {expression} AS value
+FROM {AID_TABLE}
+WHERE Transaction_Type_Name = "Disbursements" AND {expression} IS NOT NULL
+ORDER BY value{" DESC" if descending else ""}
+"""
+        return self._query(sql)["value"].tolist()
+
+    def countries(self):
+        return self._distinct(COUNTRY_SQL)
+
+    def years(self):
+        return self._distinct("Fiscal_Year", descending=True)
+
+    def agencies(self):
+        return self._distinct("Funding_Agency_Name")
+
+    def total(self, country, year, agency):
+        where, params = self._where(country, year, agency)
+        result = self._query(f"SELECT SUM({AMOUNT}) AS total FROM {AID_TABLE} WHERE {where}", params)
+        total = result["total"].iloc[0]
+        return 0 if pd.isna(total) else total
+
+    def timeline(self, country, agency):
+        where, params = self._where(country, ALL, agency)
+        sql = f"""
+SELECT {COUNTRY_SQL} AS Country_Name, Fiscal_Year, SUM({AMOUNT}) AS {AMOUNT}
+FROM {AID_TABLE}
+WHERE {where}
+GROUP BY Country_Name, Fiscal_Year
+ORDER BY Country_Name, Fiscal_Year
+"""
+        return self._query(sql, params)
+
+    def breakdown(self, country, year, sort_variable):
+        if sort_variable not in SORT_VARIABLES:  # interpolated as an identifier, so whitelist it
+            raise ValueError(f"cannot break aid down by {sort_variable!r}")
+        where, params = self._where(country, year)
+        sql = f"""
+SELECT {sort_variable}, SUM({AMOUNT}) AS {AMOUNT}
+FROM {AID_TABLE}
+WHERE {where}
+GROUP BY {sort_variable}
+ORDER BY {AMOUNT}
+"""
+        return self._query(sql, params)
+
+    def top_activities(self, country, year, n=10):
+        where, params = self._where(country, year)
+        sql = f"""
+SELECT Activity_Name, Activity_Description, SUM({AMOUNT}) AS {AMOUNT}
+FROM {AID_TABLE}
+WHERE {where}
+GROUP BY Activity_Name, Activity_Description
+ORDER BY {AMOUNT} DESC
+LIMIT @n
+"""
+        return self._query(sql, {**params, "n": n})
+
+    def detail(self, country, year, agency, page=1, sort=None, descending=False):
+        if sort is not None and sort not in DETAIL_SORT_COLUMNS:  # interpolated as an identifier, so whitelist it
+            raise ValueError(f"cannot sort the detail table by {sort!r}")
+        where, params = self._where(country, year, agency)
+        order = f"{sort} {'DESC' if descending else 'ASC'} NULLS LAST" if sort else "Fiscal_Year DESC"
+        sql = f"""
+SELECT {DETAIL_COLUMNS}
+FROM {AID_TABLE}
+WHERE {where}
+ORDER BY {order}, {DETAIL_TIEBREAK}
+LIMIT @limit OFFSET @offset
+"""
+        return self._query(sql, {**params, "limit": PAGE_SIZE, "offset": (page - 1) * PAGE_SIZE})
+
+    def detail_rows(self, country, year, agency):
+        where, params = self._where(country, year, agency)
+        return int(self._query(f"SELECT COUNT(*) AS n FROM {AID_TABLE} WHERE {where}", params)["n"].iloc[0])
@@ -0,0 +1,186 @@
+"""Rerun latency of every dashboard widget, measured headlessly on synthetic data.
+
+    python benchmarks/rerun_latency.py --scales 1 10 100 --repeats 20 --out rerun_latency.json
+
+For each scale, synthetic.py writes a dataset of that multiple of the production
+size and a fresh worker process drives streamlit.py through Streamlit's AppTest
+API. The worker records the cold-start run, then opens each page and changes
+each of its widgets in turn, ``--repeats`` times. It reports p50/p95 rerun
+time per widget (and for switching to each page) and, from one extra
+tracemalloc pass, the peak Python heap growth of each interaction. The results
+are written as JSON so runs can be diffed.
+
+Run it as a script from anywhere, not with ``-m`` from the repository root:
+the app is called streamlit.py, so the repository root must not come before
+site-packages on sys.path. It needs ``pip install duckdb sqlglot`` even with
+``--source files``, because synthetic.py produces the result sets by running
+the dashboard's SQL through DuckDB.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))  # appended, so `import streamlit` above still resolved to the real package
+
+import synthetic  # noqa: E402
+
+APP = ROOT / "streamlit.py"
+PAGE_KEY = "page"
+# each page's widget keys in order, with the element type AppTest files them under
+INTERACTIONS = {
+    "Foreign aid": {
+        "aid_country": "selectbox",
+        "aid_year": "selectbox",
+        "aid_agency": "selectbox",
+        "detail_sort": "selectbox",
+        "country_bar": "selectbox",
+        "year_bar": "selectbox",
+        "sort_by_bar": "selectbox",
+    },
+    "Conflict timeline": {
+        "political_months": "select_slider",
+        "y_axis_toggle": "selectbox",
+    },
+    "Healthcare attacks": {
+        "health_metric_toggle": "selectbox",
+        "category_toggle": "selectbox",
+    },
+}
+
+
+def change(at, key, kind, step):
+    """Move widget ``key`` to another of its options, cycling so every repeat is a real change."""
+    widget = getattr(at, kind)(key=key)
+    options = widget.options
+    if kind == "select_slider":  # a month range: move its start, keeping the end at the latest month
+        # (AppTest lists the formatted labels, which the app's format_func reads back as months)
+        widget.set_range(options[(1 + step) % (len(options) - 1)], options[-1])
+        return
+    current = options.index(str(widget.value)) if str(widget.value) in options else 0
+    widget.select_index((current + 1 + step % max(1, len(options) - 1)) % len(options))
+
+
+def interactions(at):
+    """Yield ``(name, change)`` for every timed rerun: opening each page, then each of its widgets."""
+    for page, widgets in INTERACTIONS.items():
+        yield f"page: {page}", lambda step, page=page: at.radio(key=PAGE_KEY).set_value(page)
+        for key, kind in widgets.items():
+            yield key, lambda step, key=key, kind=kind: change(at, key, kind, step)
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 2)
+
+
+def check(at, name):
+    """Stop the run if the app raised, rather than timing an error page as a rerun."""
+    if at.exception:
+        raise RuntimeError(f"the app raised on {name}: {at.exception[0].value}")
+
+
+def measure(repeats, timeout):
+    at = AppTest.from_file(str(APP), default_timeout=timeout)
+    start = time.perf_counter()
+    at.run()
+    cold_start = time.perf_counter() - start
+    check(at, "its first run")
+
+    timings = {}
+    for step in range(repeats):
+        for name, act in interactions(at):
+            act(step)
+            start = time.perf_counter()
+            at.run()
+            timings.setdefault(name, []).append(time.perf_counter() - start)
+            check(at, name)
+
+    # a separate pass, since tracing allocations slows the timed runs down
+    peaks = {}
+    tracemalloc.start()
+    for name, act in interactions(at):
+        act(repeats)
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        at.run()
+        peaks[name] = round((tracemalloc.get_traced_memory()[1] - baseline) / 2**20, 2)
+        check(at, name)
+    tracemalloc.stop()
+
+    return {
+        "cold_start_s": round(cold_start, 3),
+        "interactions": {
+            name: {
+                "runs": len(runs),
+                "p50_ms": percentile(runs, 50),
+                "p95_ms": percentile(runs, 95),
+                "peak_heap_mb": peaks[name],
+            }
+            for name, runs in timings.items()
+        },
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_scale(scale, args, workdir):
+    data_dir = workdir / f"scale-{scale:g}"
+    rows = synthetic.generate(data_dir, scale)
+    env = {
+        **os.environ,
+        "DASHBOARD_SOURCE": args.source,
+        "DASHBOARD_DATA_DIR": str(data_dir),
+        # a store and snapshots of its own, so no scale is served another one's data
+        "DASHBOARD_STORE_DIR": str(workdir / f"store-{scale:g}"),
+        "DASHBOARD_SNAPSHOT_DIR": str(workdir / f"snapshots-{scale:g}"),
+    }
+    # one process per scale, so caches and peak RSS don't leak from one size into the next
+    worker = subprocess.run(
+        [sys.executable, __file__, "--worker", "--repeats", str(args.repeats), "--timeout", str(args.timeout)],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return {"scale": scale, "rows": rows, **json.loads(worker.stdout.strip().splitlines()[-1])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeats", type=int, default=10, help="changes of each widget per scale")
+    parser.add_argument("--source", choices=["files", "duckdb"], default="files")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds allowed for a single rerun")
+    parser.add_argument("--out", help="write the JSON here instead of stdout")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.repeats, args.timeout)))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="dashboard-bench-") as workdir:
+        results = {
+            "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "source": args.source,
+            "repeats": args.repeats,
+            "scales": [run_scale(scale, args, Path(workdir)) for scale in args.scales],
+        }
+    output = json.dumps(results, indent=2)
+    if args.out:
+        Path(args.out).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
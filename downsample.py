@@ -0,0 +1,49 @@
+"""Thin long time series out before they are sent to the browser.
+
+A line chart can't show more points than it has pixels across, so every
+series is cut to at most ``CHART_POINTS`` points with largest-triangle-three-
+buckets (LTTB): the points are split into equal buckets, and from each one the
+point forming the largest triangle with the previous pick and the next bucket's
+average is kept. Peaks and troughs survive, unlike with every-nth sampling.
+Series that already fit are returned untouched, so a narrow enough window
+shows every point.
+"""
+import os
+
+import numpy as np
+
+CHART_POINTS = int(os.environ.get("DASHBOARD_CHART_POINTS", 800))  # about a chart's width in pixels
+
+
+def lttb(x, y, points=CHART_POINTS):
+    """Positions of the ``points`` points of the series (x, y) that LTTB keeps, first and last included."""
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+    x = np.asarray(x).astype("float64")  # dates as nanoseconds
+    y = np.nan_to_num(np.asarray(y, dtype="float64"))
+    # points - 2 buckets between the first and last point, which are always kept
+    edges = np.linspace(1, n - 1, points - 1).astype(np.intp)
+    kept = np.empty(points, dtype=np.intp)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        cx, cy = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = kept[i + 1] = lo + int(area.argmax())
+    return kept
+
+
+def downsample(df, x, y, by=None, points=CHART_POINTS):
+    """``df`` with every ``by`` group's series cut to ``points`` rows, or ``df`` itself if they all fit.
+
+    Rows are expected in ``x`` order within each group.
+    """
+    groups = df.groupby(by, sort=False).indices.values() if by else [np.arange(len(df))]
+    if all(len(rows) <= points for rows in groups):
+        return df
+    xs, ys = df[x].to_numpy(), df[y].to_numpy(dtype="float64", na_value=np.nan)
+    keep = np.concatenate([rows[lttb(xs[rows], ys[rows], points)] for rows in groups])
+    return df.take(np.sort(keep))
@@ -0,0 +1,64 @@
+"""Plotly figures reused across reruns.
+
+Building a Plotly Express figure (and the reshaping that feeds it) is a large
+part of every rerun, even when the widget that changed belongs to another
+chart. ``FigureCache`` keeps each figure as its serialized JSON under a key of
+the dataset's version plus the widget values the chart depends on, so an
+unchanged chart is a dictionary lookup and a cheap ``from_json``. Entries are
+evicted least-recently-used once their JSON passes a byte budget.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import plotly.io as pio
+
+FIGURE_CACHE_BYTES = int(os.environ.get("DASHBOARD_FIGURE_CACHE_BYTES", 64 * 2**20))
+
+
+class FigureCache:
+    def __init__(self, max_bytes=FIGURE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()  # key -> figure JSON
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """Return the figure stored under ``key``, calling ``build()`` to make it on a miss."""
+        with self._lock:
+            spec = self._entries.get(key)
+            if spec is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if spec is not None:
+            # a fresh figure each time, so a caller's update_* can't change the stored one
+            return pio.from_json(spec, skip_invalid=True)
+        fig = build()
+        self._put(key, pio.to_json(fig, validate=False))
+        return fig
+
+    def _put(self, key, spec):
+        with self._lock:
+            self.misses += 1
+            if len(spec) > self.max_bytes:
+                return  # would evict everything else and still not fit
+            if key in self._entries:  # another session built it first
+                self.nbytes -= len(self._entries.pop(key))
+            self._entries[key] = spec
+            self.nbytes += len(spec)
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "figures": len(self._entries),
+                "mb": round(self.nbytes / 2**20, 2),
+                "budget_mb": round(self.max_bytes / 2**20, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,83 @@
+"""Inverted index from column values to row positions.
+
+Built once per data load, it turns a widget selection into the intersection
+of a few sorted position arrays, so a rerun never scans or copies the whole
+frame. Selecting "All" everywhere hands back the frame itself.
+
+``SortIndex`` keeps a rank per row for each column it has been asked to sort
+by, so any such set of positions can be put in column order by sorting small
+integers rather than the frame.
+"""
+import threading
+
+import numpy as np
+
+ALL = "All"
+EMPTY = np.zeros(0, dtype=np.intp)
+
+
+def intersect_sorted(a, b):
+    """Positions present in both sorted, duplicate-free arrays, in O(len(a) log len(b))."""
+    if len(a) > len(b):
+        a, b = b, a
+    if not len(a):
+        return EMPTY
+    found = np.searchsorted(b, a).clip(max=len(b) - 1)
+    return a[b[found] == a]
+
+
+class FilterIndex:
+    def __init__(self, df, columns):
+        self.df = df
+        # groupby(...).indices maps each value to its sorted row positions; missing keys are left out
+        self.positions = {column: df.groupby(column, observed=True, sort=False).indices for column in columns}
+
+    def rows(self, **selection):
+        """Sorted row positions matching every ``column=value`` pair, or None when nothing is filtered."""
+        arrays = [
+            self.positions[column].get(value, EMPTY)
+            for column, value in selection.items()
+            if not (isinstance(value, str) and value == ALL)
+        ]
+        if not arrays:
+            return None
+        arrays.sort(key=len)  # start from the most selective column
+        rows = arrays[0]
+        for other in arrays[1:]:
+            rows = intersect_sorted(rows, other)
+        return rows
+
+    def select(self, **selection):
+        rows = self.rows(**selection)
+        return self.df if rows is None else self.df.take(rows)
+
+
+class SortIndex:
+    def __init__(self, df):
+        self.df = df
+        self._ranks = {}  # column -> (order, rank, missing), built on first use
+        self._lock = threading.Lock()
+
+    def _build(self, column):
+        with self._lock:
+            if column not in self._ranks:
+                values = self.df[column].reset_index(drop=True)
+                order = values.sort_values(kind="stable", na_position="last").index.to_numpy()
+                rank = np.empty(len(order), dtype=np.intp)
+                rank[order] = np.arange(len(order))
+                self._ranks[column] = (order, rank, values.isna().to_numpy())
+        return self._ranks[column]
+
+    def order(self, rows, column, descending=False):
+        """``rows`` (sorted positions, or None for every row) in ``column`` order, missing values last."""
+        order, rank, missing = self._ranks.get(column) or self._build(column)
+        if rows is None:
+            if not descending:
+                return order
+            present = len(order) - int(missing.sum())
+            return np.concatenate([order[:present][::-1], order[present:]])
+        key = rank[rows]
+        if descending:
+            # missing values hold the top ranks, so negating only the others keeps them last
+            key = np.where(missing[rows], key, -key)
+        return rows[np.argsort(key, kind="stable")]
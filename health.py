@@ -0,0 +1,47 @@
+"""Section 3's charts, rolled up from one scan of the health table.
+
+``query_health`` groups ``data342.israel.health`` by country, weapon and
+location. That table is small, and ``HealthData`` rolls it up once per load
+into everything the section shows: each country's totals for the pie
+metrics, and the most frequent weapons and locations on each side. A toggle
+then only looks a frame up.
+"""
+from prepare import dataset_stamp
+
+METRICS = [
+    "health_workers_killed",
+    "health_workers_injured",
+    "healthcare_facilities_damanged",
+    "healthcare_facilities_occupied",
+    "health_transportation_damanged",
+    "health_supplies_looted",
+]
+# category column -> name of its count in the charts
+CATEGORIES = {"weapon_used": "weapon_usage_count", "incident_location": "attack_count"}
+TOP_CATEGORIES = 5
+
+
+class HealthData:
+    def __init__(self, facts):
+        self.facts = facts
+        self.version, self.fetched_at = dataset_stamp(facts)
+        by_country = facts.groupby("Country", observed=True)
+        self.totals = by_country[METRICS].sum()  # a country with no values counts as 0, so the pie keeps its slice
+        self.totals["weapons_used"] = by_country["weapon_used"].nunique()
+        self.totals = self.totals.reset_index()
+
+        self.top = {}  # (category column, country) -> its most frequent values, largest first
+        for column, count in CATEGORIES.items():
+            ranked = facts.groupby(["Country", column], observed=True, as_index=False)["attack_count"].sum()
+            ranked = ranked.rename(columns={"attack_count": count}).sort_values(count, ascending=False, kind="stable")
+            for country, rows in ranked.groupby("Country", observed=True, sort=False):
+                self.top[column, country] = rows.head(TOP_CATEGORIES).reset_index(drop=True)
+            self.top[column, None] = ranked.iloc[:0].reset_index(drop=True)
+
+    def pie(self, metric):
+        """Each country's total of ``metric``."""
+        return self.totals[["Country", metric]]
+
+    def top_categories(self, column, country):
+        """The TOP_CATEGORIES most frequent ``column`` values (weapon or location) on ``country``'s side."""
+        return self.top.get((column, country), self.top[column, None])
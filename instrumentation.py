@@ -0,0 +1,109 @@
+"""Opt-in timing of the dashboard's named stages.
+
+Turn it on with ``DASHBOARD_TRACE=1`` or by opening the app with ``?debug=1``.
+Each rerun then gets a Trace (a fragment rerun gets its own, see
+``Trace.for_fragment``), and every ``with trace.stage(section, name)``
+block records its wall time, the resident-memory change and, when the block
+reports one, the size of the DataFrame it produced. The stages of the current
+rerun are shown in a sidebar table and appended to a rotating JSONL file, so
+slowness in production can be pinned on one chart. When tracing is off a
+stage costs one attribute check.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+ENABLED = os.environ.get("DASHBOARD_TRACE", "") == "1"
+TRACE_FILE = Path(os.environ.get("DASHBOARD_TRACE_FILE", Path(__file__).parent / ".traces" / "trace.jsonl"))
+TRACE_FILE_BYTES = int(os.environ.get("DASHBOARD_TRACE_FILE_BYTES", 5 * 2**20))
+TRACE_FILE_BACKUPS = 3
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def rss_bytes():
+    """Resident set size of this process, or None where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def trace_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = logging.getLogger("dashboard.trace")
+            _writer.propagate = False
+            _writer.setLevel(logging.INFO)
+            try:
+                TRACE_FILE.parent.mkdir(parents=True, exist_ok=True)
+                handler = RotatingFileHandler(TRACE_FILE, maxBytes=TRACE_FILE_BYTES, backupCount=TRACE_FILE_BACKUPS)
+            except OSError:
+                handler = logging.NullHandler()  # tracing must never break the page
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            _writer.addHandler(handler)
+    return _writer
+
+
+class Stage:
+    def __init__(self, record):
+        self.record = record
+
+    def frame(self, df):
+        """Note the size of the DataFrame this stage produced."""
+        if self.record is not None and df is not None:
+            self.record["rows"] = len(df)
+            self.record["frame_mb"] = round(df.memory_usage(deep=False).sum() / 2**20, 3)
+        return df
+
+
+_NO_STAGE = Stage(None)
+
+
+class Trace:
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self.run_id = uuid.uuid4().hex[:12]
+        self.records = []
+        self.closed = False
+
+    def close(self):
+        """Mark the run as over; stages of later fragment reruns go to new traces."""
+        self.closed = True
+
+    def for_fragment(self):
+        """This trace while its run is going, or a new one, with its own run id, for a fragment rerun after it."""
+        return Trace(self.enabled) if self.closed else self
+
+    @contextmanager
+    def stage(self, section, name):
+        if not self.enabled:
+            yield _NO_STAGE
+            return
+        record = {"run": self.run_id, "section": section, "stage": name}
+        rss_before = rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield Stage(record)
+        finally:
+            record["ms"] = round((time.perf_counter() - start) * 1000, 3)
+            rss_after = rss_bytes()
+            if rss_before is not None and rss_after is not None:
+                record["rss_delta_mb"] = round((rss_after - rss_before) / 2**20, 3)
+            record["at"] = round(time.time(), 3)
+            self.records.append(record)
+            trace_writer().info(json.dumps(record))
+
+    def table(self):
+        columns = ["section", "stage", "ms", "rows", "frame_mb", "rss_delta_mb"]
+        return [{column: record.get(column) for column in columns} for record in self.records]
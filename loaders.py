@@ -0,0 +1,109 @@
+"""Run the dashboard's dataset loaders side by side.
+
+Cold-start latency becomes the slowest query rather than the sum of all of
+them, and since the loaders are only waited on when a section needs their
+result, earlier sections render while later datasets are still downloading.
+A failing loader is recorded in the report and never stops the others.
+
+``prefetch`` runs loaders whose results nobody is waiting for yet, after the
+ones that are, so their caches are warm by the time they are asked for.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:  # running outside streamlit
+    add_script_run_ctx = get_script_run_ctx = None
+
+logger = logging.getLogger(__name__)
+
+
+class LoadReport:
+    def __init__(self):
+        self.futures = {}
+        self.timings = {}  # name -> seconds, filled in as each loader finishes
+
+    def done(self, name):
+        return self.futures[name].done()
+
+    def wait(self, name, timeout=None):
+        """Block up to ``timeout`` seconds for ``name``; True once it has finished."""
+        return not wait([self.futures[name]], timeout).not_done
+
+    def result(self, name, timeout=None):
+        """Wait for ``name`` and return its frame, re-raising the loader's exception if it failed."""
+        return self.futures[name].result(timeout)
+
+    def wait_all(self, timeout=None):
+        wait(self.futures.values(), timeout)
+
+    @property
+    def frames(self):
+        return {
+            name: future.result()
+            for name, future in self.futures.items()
+            if future.done() and future.exception() is None
+        }
+
+    @property
+    def errors(self):
+        return {
+            name: future.exception()
+            for name, future in self.futures.items()
+            if future.done() and future.exception() is not None
+        }
+
+    def timing_rows(self):
+        errors = self.errors
+        return [
+            {"dataset": name, "seconds": round(seconds, 3), "status": "failed" if name in errors else "ok"}
+            for name, seconds in self.timings.items()
+        ]
+
+
+def load_concurrently(loaders, max_workers=None):
+    """Start every ``name -> loader`` in ``loaders`` on a thread pool and return without waiting."""
+    report = LoadReport()
+    # st.cache_data inside a worker thread needs the session's script context
+    ctx = get_script_run_ctx(suppress_warning=True) if get_script_run_ctx else None
+
+    def run(name, loader):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        start = time.perf_counter()
+        try:
+            return loader()
+        except Exception:
+            logger.exception("loading %s failed", name)
+            raise
+        finally:
+            report.timings[name] = time.perf_counter() - start
+            logger.info("%s finished in %.3fs", name, report.timings[name])
+
+    pool = ThreadPoolExecutor(max_workers=max_workers or max(1, len(loaders)), thread_name_prefix="loader")
+    report.futures = {name: pool.submit(run, name, loader) for name, loader in loaders.items()}
+    pool.shutdown(wait=False)  # the submitted loaders keep running, the caller waits per dataset
+    return report
+
+
+def prefetch(loaders, after=None, max_workers=None):
+    """Run ``loaders`` in the background once the report ``after`` has finished, discarding the results.
+
+    The loaders are expected to cache what they load; this only makes sure the
+    first real call finds it there.
+    """
+    ctx = get_script_run_ctx(suppress_warning=True) if get_script_run_ctx else None
+
+    def run():
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        if after is not None:
+            after.wait_all()  # don't compete with the datasets the page is waiting on
+        load_concurrently(loaders, max_workers).wait_all()
+
+    thread = threading.Thread(target=run, name="prefetch", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,140 @@
+"""Typed, compact versions of the raw query results.
+
+BigQuery hands strings back as Python objects. The aid table repeats a few
+hundred distinct names across every row, so dictionary-encoding those columns
+(categoricals with the narrowest integer codes pandas can pick) shrinks it
+severalfold and makes grouping on them integer work.
+
+The monthly conflict tables get their ``date`` column here too, once per load,
+rather than on every rerun of the script, and are melted into the long form
+the timeline charts plot.
+"""
+import calendar
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+AID_CATEGORICAL_COLUMNS = [
+    "Country_Name",
+    "Funding_Agency_Name",
+    "Foreign_Assistance_Objective_Name",
+    "International_Purpose_Name",
+    "International_Category_Name",
+    "International_Sector_Name",
+    "Activity_Name",
+    "Activity_Description",
+]
+
+
+def dataset_stamp(df):
+    """``(version, fetched_at)`` of a loaded frame, from the ``attrs`` streamlit.fetch_dataset sets.
+
+    The version changes on every reload and keys the figure cache (see
+    figures.py); the fetch time schedules the background refresh (see refresh.py).
+    Both are None for a frame that didn't come through a load.
+    """
+    return df.attrs.get("version"), df.attrs.get("fetched_at")
+
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def plain_memory_mb(df):
+    """``memory_mb`` of ``df`` as it would be with its categoricals decoded back to plain strings.
+
+    streaming.download already dictionary-encodes the aid columns, so the frame
+    as loaded is no baseline. Columns are decoded one at a time to keep the peak low.
+    """
+    total = df.memory_usage(deep=True).sum()
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            plain = series.astype(series.cat.categories.dtype)
+            total += plain.memory_usage(deep=True, index=False) - series.memory_usage(deep=True, index=False)
+    return total / 2**20
+
+
+def replace_value(series, old, new):
+    """``series.replace(old, new)`` that keeps a categorical a categorical."""
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return series.replace(old, new)
+    if old not in series.cat.categories:
+        return series
+    if new not in series.cat.categories:
+        return series.cat.rename_categories({old: new})
+    return series.where(series != old, new).cat.remove_unused_categories()
+
+
+def typed_aid(df):
+    """Rename West Bank and Gaza to Palestine and dictionary-encode the string columns.
+
+    Columns that arrive already dictionary-encoded (see streaming.download) are left as they are.
+    """
+    df = df.assign(Country_Name=replace_value(df["Country_Name"], "West Bank and Gaza", "Palestine"))
+    for column in AID_CATEGORICAL_COLUMNS:
+        if column in df:
+            values = df[column].astype("category")
+            # Arrow dictionaries come in first-seen order; sorted categories keep
+            # groupby output in the same order as grouping the plain strings
+            df[column] = values.cat.reorder_categories(sorted(values.cat.categories))
+    # the nullable Int64 of streaming.download becomes Int16, missing years and all
+    df["Fiscal_Year"] = pd.to_numeric(df["Fiscal_Year"], downcast="integer")
+    return df
+
+
+MONTH_NUMBERS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+
+
+def with_month_dates(df):
+    """Add a ``date`` column from ``Year`` and the month name in ``Month``, drop rows without one and sort by it.
+
+    The date is computed as months since the epoch rather than by formatting
+    and parsing "2020-January" strings.
+    """
+    year = pd.to_numeric(df["Year"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    month = df["Month"].astype("string").str.strip().str.lower().map(MONTH_NUMBERS)
+    month = month.to_numpy(dtype="float64", na_value=np.nan)
+    valid = ~(np.isnan(year) | np.isnan(month))
+    months = (year[valid].astype("int64") - 1970) * 12 + month[valid].astype("int64") - 1
+    df = df[valid].assign(date=months.astype("datetime64[M]").astype("datetime64[us]"))
+    return df.sort_values("date", kind="stable", ignore_index=True)
+
+
+# conflict column -> (metric, series label) in the timeline charts
+CONFLICT_SERIES = {
+    "pse_events": ("Events", "Palestine Events"),
+    "israel_events": ("Events", "Israel Events"),
+    "pse_fatalities": ("Fatalities", "Palestine Fatalities"),
+    "israel_fatalities": ("Fatalities", "Israel Fatalities"),
+}
+
+
+def long_conflict(df):
+    """The tagged conflict rows as one ``source, metric, Group, date, Count`` row per series and month.
+
+    Sorted by source, metric and series, then date, so each chart line is a
+    contiguous, dated run of rows.
+    """
+    df = with_month_dates(df)
+    long = df.melt(id_vars=["source", "date"], value_vars=list(CONFLICT_SERIES), var_name="column", value_name="Count")
+    metric, group = (pd.Series({column: names[i] for column, names in CONFLICT_SERIES.items()}) for i in (0, 1))
+    long = pd.DataFrame({
+        "source": long["source"].astype("category"),
+        "metric": pd.Categorical(long["column"].map(metric), categories=metric.unique()),
+        # in CONFLICT_SERIES order, so Palestine keeps the first line colour
+        "Group": pd.Categorical(long["column"].map(group), categories=group.unique()),
+        "date": long["date"],
+        "Count": long["Count"],
+    })
+    long.attrs = dict(df.attrs)  # the fetch time and version stamp, which a new frame doesn't inherit
+    return long.sort_values(["source", "metric", "Group", "date"], kind="stable", ignore_index=True)
+
+
+def memory_report(before, after):
+    report = {"before_mb": round(float(plain_memory_mb(before)), 2), "after_mb": round(float(memory_mb(after)), 2)}
+    logger.info("aid frame: %(before_mb).2f MB as plain strings, %(after_mb).2f MB typed", report)
+    return report
@@ -0,0 +1,43 @@
+"""SQL for the dashboard's three datasets, written against the BigQuery tables in ``data342.israel``."""
+
+query = """
+SELECT Country_Name, Fiscal_Year, Current_Dollar_Amount, Activity_Name, Activity_Description,
+Funding_Agency_Name, Foreign_Assistance_Objective_Name, International_Purpose_Name
+, International_Category_Name, International_Sector_Name
+FROM `data342.israel.trunc3`
+WHERE Transaction_Type_Name = "Disbursements"
+--GROUP BY Country_Name, Fiscal_Year
+ORDER BY Fiscal_Year DESC
+"""
+
+# both conflict tables have the same columns, so one round trip fetches them, tagged by source
+query_conflict = """
+SELECT 'political' AS source, Year, Month, pse_events, israel_events, pse_fatalities, israel_fatalities
+FROM `data342.israel.violence_combined`
+UNION ALL
+SELECT 'civilian' AS source, Year, Month, pse_events, israel_events, pse_fatalities, israel_fatalities
+FROM `data342.israel.civilian_combined`
+order by Year
+"""
+
+# one scan of the health table for all of section 3: grouped by country, weapon and location, which
+# health.py rolls up into the per-country totals for the pie and the top weapons / locations per side
+query_health = """
+SELECT Country, `Weapon Used` AS weapon_used, `Location of Incident` AS incident_location,
+ COUNT(*) AS attack_count,
+ sum(`Number of Attacks on Health Facilities Reporting Damaged`) as healthcare_facilities_damanged,
+ sum(`Occupation of Health Facility`) as healthcare_facilities_occupied,
+ sum(`Health Transportation Damaged`) as health_transportation_damanged,
+ sum(`Looting of Health Supplies`) as health_supplies_looted,
+ SUM(SAFE_CAST(`Health Workers Killed` AS INT64)) AS health_workers_killed,
+ sum(safe_cast(`Health Workers Injured` as int64)) as health_workers_injured
+FROM `data342.israel.health`
+GROUP BY Country, `Weapon Used`, `Location of Incident`
+"""
+
+# dataset name -> SQL, in the order the dashboard shows them
+DATASETS = {
+    "aid": query,
+    "conflict": query_conflict,
+    "health": query_health,
+}
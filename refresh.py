@@ -0,0 +1,117 @@
+"""Keep the dashboard's datasets fresh in the background.
+
+A ``Refresher`` holds the current version of every dataset and serves it to
+readers without waiting. A daemon thread reloads each dataset shortly before
+its snapshot reaches ``max_age`` and swaps the new version in as a single
+assignment, so readers see either the old frame or the new one, never a gap.
+Only the very first load of a dataset, before anything has been cached, makes
+a reader wait, and readers that arrive together share that one load (see
+singleflight.py). If a refresh fails, the previous version stays in place and
+the refresh is retried later.
+"""
+import logging
+import os
+import threading
+import time
+
+import snapshots
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# reload once a dataset is this far through its max age
+REFRESH_AT = float(os.environ.get("DASHBOARD_REFRESH_AT", 0.9))
+RETRY_AFTER = 60.0  # seconds before retrying a failed refresh
+MAX_SLEEP = 60.0  # wake up at least this often, in case the clock jumps
+
+
+def fetched_at(value):
+    """When the data behind ``value`` was fetched, from a frame's ``attrs`` or a ``fetched_at`` attribute."""
+    attrs = getattr(value, "attrs", None)
+    if isinstance(attrs, dict) and attrs.get("fetched_at") is not None:
+        return attrs["fetched_at"]
+    return getattr(value, "fetched_at", None) or time.time()
+
+
+class Refresher:
+    """Serves ``loaders`` (name -> ``load(max_age)``) and reloads them before they go stale."""
+
+    def __init__(self, loaders, max_age=snapshots.MAX_AGE, refresh_at=REFRESH_AT):
+        self.loaders = loaders
+        self.max_age = max_age
+        self.refresh_at = refresh_at
+        self._current = {}  # name -> (value, fetched_at)
+        self._due = {}  # name -> time of the next refresh
+        self.flight = SingleFlight()  # one load per dataset at a time, whoever asks for it
+        self._stats = {name: {"refreshes": 0, "failures": 0, "last_refresh_s": None} for name in loaders}
+        self._wake = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def get(self, name):
+        """The current version of ``name``, loading it first if nothing has been loaded yet."""
+        entry = self._current.get(name)
+        if entry is None:
+            # a snapshot that is still fresh is good enough for the first load
+            entry = self.flight.do(name, lambda: self._current.get(name) or self._load(name, self.max_age))
+        self._start()
+        return entry[0]
+
+    def _load(self, name, max_age):
+        start = time.perf_counter()
+        value = self.loaders[name](max_age)
+        entry = (value, fetched_at(value))
+        self._current[name] = entry  # the swap: one dict assignment, readers never see half of it
+        # never sooner than RETRY_AFTER: a snapshot that couldn't be rewritten keeps its old fetch time
+        self._due[name] = max(entry[1] + self.max_age * self.refresh_at, time.time() + RETRY_AFTER)
+        self._stats[name]["last_refresh_s"] = round(time.perf_counter() - start, 3)
+        self._wake.set()
+        return entry
+
+    def refresh(self, name):
+        """Reload ``name``, keeping the old version if that fails.
+
+        Only data fetched within the refresh window is accepted, which is whatever
+        another process on the host has just refreshed, or else a new fetch.
+        """
+        try:
+            self.flight.do(name, lambda: self._load(name, self.max_age * (1 - self.refresh_at)))
+        except Exception:
+            self._stats[name]["failures"] += 1
+            self._due[name] = time.time() + RETRY_AFTER
+            logger.exception("refreshing %s failed, still serving the previous version", name)
+            return
+        self._stats[name]["refreshes"] += 1
+        logger.info("refreshed %s in %.3fs", name, self._stats[name]["last_refresh_s"])
+
+    def _start(self):
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="refresher", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            now = time.time()
+            for name, due in list(self._due.items()):
+                if due <= now:
+                    self.refresh(name)
+            next_due = min(self._due.values(), default=now + MAX_SLEEP)
+            self._wake.wait(min(max(next_due - time.time(), 0.0), MAX_SLEEP))
+
+    def stats(self):
+        now = time.time()
+        rows = []
+        for name in self.loaders:
+            entry = self._current.get(name)
+            due = self._due.get(name)
+            rows.append({
+                "dataset": name,
+                "age_s": round(now - entry[1], 1) if entry else None,
+                "next_refresh_s": round(max(due - now, 0.0), 1) if due else None,
+                **self._stats[name],
+                "coalesced": self.flight.coalesced[name],
+            })
+        return rows
@@ -0,0 +1,49 @@
+"""Collapse concurrent calls for the same key into one.
+
+When several sessions hit a cold replica at once, each would otherwise run
+its own copy of the same query. ``SingleFlight.do(key, fn)`` runs ``fn`` for
+the first caller only; callers that arrive while it is in flight wait for it
+and get the same result, or the same exception. Nothing is kept once the call
+returns, so caching is still the caller's business.
+"""
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    def __init__(self):
+        self.executions = 0  # calls that ran fn
+        self.coalesced = Counter()  # key -> calls that waited on another caller's fn
+        self._in_flight = {}  # key -> Future of the running call
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                self.executions += 1
+            else:
+                self.coalesced[key] += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": sum(self.coalesced.values()),
+            }
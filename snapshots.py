@@ -0,0 +1,197 @@
+"""On-disk snapshots of the dashboard's query results.
+
+Each result set is written to ``<SNAPSHOT_DIR>/<name>.parquet`` with the query
+hash, fetch time and row count stored in the Parquet schema metadata, so a
+cold process can serve the last fetch instead of going back to BigQuery.
+
+Datasets that only grow at the end (a new fiscal year, a new month) can name a
+watermark column. Its maximum is stored with the snapshot, and once the
+snapshot goes stale only rows at or past the watermark are fetched and merged
+in, instead of the full history. The latest period is refetched rather than
+skipped, because it is the one still being filled in.
+
+Where the source can report when its tables last changed, a snapshot is also
+addressed by its content: a hash of the query plus the modification times of
+the tables it reads. That cheap metadata check decides whether a snapshot is
+still valid, so unchanged tables are never downloaded again however old the
+snapshot is, and a changed table is refetched even when the snapshot is
+young. Sources without that metadata fall back to ``max_age``.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = Path(os.environ.get("DASHBOARD_SNAPSHOT_DIR", Path(__file__).parent / ".snapshots"))
+MAX_AGE = float(os.environ.get("DASHBOARD_SNAPSHOT_MAX_AGE", 24 * 60 * 60))  # seconds
+META_KEY = b"dashboard_snapshot"
+# ignore watermarks and refetch everything, e.g. after a backfill of old rows
+FULL_RELOAD = os.environ.get("DASHBOARD_FULL_RELOAD", "") == "1"
+
+
+def query_hash(sql):
+    # whitespace-insensitive so reformatting a query doesn't invalidate its snapshot
+    return hashlib.sha256(" ".join(sql.split()).encode()).hexdigest()[:16]
+
+
+def content_key(sql, table_versions):
+    """Hash of the query and the versions of the tables it reads, or None if those are unknown."""
+    if table_versions is None:
+        return None
+    text = " ".join(sql.split()) + json.dumps(table_versions, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def current_versions(name, table_versions):
+    """Call ``table_versions()``, or return None if there is no such check or it fails."""
+    if table_versions is None:
+        return None
+    try:
+        return table_versions()
+    except Exception:
+        logger.warning("could not check the tables behind %s, falling back to its age", name, exc_info=True)
+        return None
+
+
+def snapshot_path(name):
+    return SNAPSHOT_DIR / f"{name}.parquet"
+
+
+def read_meta(name):
+    path = snapshot_path(name)
+    if not path.exists():
+        return None
+    try:
+        metadata = pq.read_schema(path).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        logger.warning("unreadable snapshot %s", path)
+        return None
+    if META_KEY not in metadata:
+        return None
+    return json.loads(metadata[META_KEY])
+
+
+def is_fresh(meta, sql, max_age=MAX_AGE):
+    if meta is None or meta["query_hash"] != query_hash(sql):
+        return False
+    return time.time() - meta["fetched_at"] <= max_age
+
+
+def high_water_mark(df, column):
+    value = df[column].max() if len(df) else None
+    if value is None or pd.isna(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def write_snapshot(name, sql, df, watermark=None, table_versions=None, location=None):
+    meta = {
+        "name": name,
+        "query_hash": query_hash(sql),
+        "location": location,
+        "table_versions": table_versions,
+        "content_key": content_key(sql, table_versions),
+        "fetched_at": time.time(),
+        "row_count": len(df),
+        "watermark": {"column": watermark, "value": high_water_mark(df, watermark)} if watermark else None,
+    }
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), META_KEY: json.dumps(meta)})
+    path = snapshot_path(name)
+    tmp = path.with_suffix(".parquet.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table, tmp)
+        os.replace(tmp, path)  # readers never see a half-written file
+    except OSError:
+        # a read-only disk shouldn't take the dashboard down, we just lose the snapshot
+        logger.warning("could not write snapshot %s", path, exc_info=True)
+    return meta
+
+
+def incremental_sql(sql, column):
+    return f"SELECT * FROM ({sql.strip().rstrip(';')}) WHERE {column} >= @watermark"
+
+
+def concat_frames(head, tail):
+    """``pd.concat`` that keeps a column categorical if either side has it as one.
+
+    Plain ``pd.concat`` falls back to plain strings when the two sides' categories
+    differ, or when one side came back without them (an empty fetch, a snapshot
+    written by an older version).
+    """
+    merged = pd.concat([head, tail], ignore_index=True)
+    for column in merged.columns:
+        parts = [head[column], tail[column]]
+        if any(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            parts = [part.astype("category") for part in parts]
+            merged[column] = union_categoricals(parts)
+    return merged
+
+
+def refresh_incrementally(name, sql, fetch, meta, table_versions=None, location=None):
+    """Fetch rows at or past the stored watermark and merge them in, or return None if a full reload is needed."""
+    watermark = meta.get("watermark") or {}
+    column, mark = watermark.get("column"), watermark.get("value")
+    if mark is None:
+        return None
+    old = pq.read_table(snapshot_path(name)).to_pandas()
+    new = fetch(incremental_sql(sql, column), {"watermark": mark})
+    if list(new.columns) != list(old.columns):
+        logger.info("%s changed schema, reloading in full", name)
+        return None
+    # rows with no watermark value are never refetched by incremental_sql, so keep them
+    kept = old[~(old[column] >= mark).fillna(False).astype(bool)]
+    # keep the query's own ordering: newest-first tables get the new rows on top. NULLs sort
+    # last either way (and are never refetched), so they don't decide the direction
+    marks = old[column].dropna()
+    descending = marks.is_monotonic_decreasing and not marks.is_monotonic_increasing
+    df = concat_frames(new, kept) if descending else concat_frames(kept, new)
+    logger.info("%s: refreshed %d rows from %s=%s onwards, kept %d", name, len(new), column, mark, len(kept))
+    write_snapshot(name, sql, df, column, table_versions, location)
+    return df
+
+
+def cached_query(name, sql, fetch, max_age=MAX_AGE, watermark=None, table_versions=None, location=None):
+    """Serve ``name`` from its snapshot, calling ``fetch(sql, params=None)`` only when it is missing or out of date.
+
+    ``table_versions()``, if given, returns the modification times of the tables
+    the query reads. A snapshot of the same query over the same versions is
+    served at any age, and one whose tables changed is refetched. Without it,
+    or if it fails, a snapshot is out of date once it is older than ``max_age``.
+
+    ``location`` names where the query runs (see sources.py). A snapshot taken
+    somewhere else is never served or topped up, only replaced.
+
+    With a ``watermark`` column, an out-of-date snapshot is topped up incrementally
+    unless the query changed, the schema changed or DASHBOARD_FULL_RELOAD is set.
+    """
+    meta = read_meta(name)
+    same_query = (
+        meta is not None and meta["query_hash"] == query_hash(sql) and meta.get("location") == location and not FULL_RELOAD
+    )
+    versions = current_versions(name, table_versions)
+    if same_query and versions is not None and meta.get("content_key") == content_key(sql, versions):
+        df = pq.read_table(snapshot_path(name)).to_pandas()
+        if not is_fresh(meta, sql, max_age):
+            logger.info("%s: tables unchanged since the snapshot, not refetching", name)
+            write_snapshot(name, sql, df, watermark, versions, location)  # restamp it, so it counts as fresh again
+        return df
+    if same_query and versions is None and is_fresh(meta, sql, max_age):
+        return pq.read_table(snapshot_path(name)).to_pandas()
+    if watermark and same_query:
+        df = refresh_incrementally(name, sql, fetch, meta, versions, location)
+        if df is not None:
+            return df
+    df = fetch(sql)
+    write_snapshot(name, sql, df, watermark, versions, location)
+    return df
@@ -0,0 +1,200 @@
+"""Where the dashboard's datasets come from.
+
+Every source answers the same two calls with the BigQuery SQL in queries.py:
+``download`` for a whole dataset and ``query`` for the small parameterized
+aggregates of the pushdown mode. ``location`` names where the data lives (the
+resolved data directory for the local sources), and ``versions`` reports what
+the data behind a dataset currently is: when the tables its query reads last
+changed, or which result file it is. Together they decide whether a snapshot
+or a stored frame is still valid. ``DASHBOARD_SOURCE`` picks one of
+
+* ``bigquery`` (default): the production tables.
+* ``duckdb``: the same SQL text, transpiled with sqlglot, run by an embedded
+  DuckDB over local copies of the tables in ``<DASHBOARD_DATA_DIR>/tables``.
+* ``files``: precomputed result sets in ``<DASHBOARD_DATA_DIR>/<dataset>.parquet``
+  (or ``.csv``). The SQL is ignored, so there is no pushdown or incremental refresh.
+
+``python synthetic.py`` writes both layouts at any scale for offline runs.
+"""
+import functools
+import os
+import re
+import threading
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+import streaming
+
+SOURCE = os.environ.get("DASHBOARD_SOURCE", "bigquery")
+DATA_DIR = Path(os.environ.get("DASHBOARD_DATA_DIR", Path(__file__).parent / "data"))
+PROJECT, DATASET = "data342", "israel"  # the catalog the SQL in queries.py refers to
+TABLE_PATTERN = re.compile(rf"{PROJECT}\.{DATASET}\.(\w+)")
+
+
+def referenced_tables(sql):
+    """Names of the ``data342.israel`` tables ``sql`` reads, e.g. ``["trunc3"]``."""
+    return sorted(set(TABLE_PATTERN.findall(sql)))
+
+
+class BigQuerySource:
+    supports_sql = True  # results are worth snapshotting, and can be topped up incrementally
+    location = f"bigquery:{PROJECT}.{DATASET}"
+
+    def __init__(self, client=None):
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # created on first use rather than at import, so nothing needs credentials until a query runs
+        with self._lock:
+            if self._client is None:
+                from google.cloud import bigquery
+
+                self._client = bigquery.Client()
+        return self._client
+
+    @staticmethod
+    def job_config(params=None):
+        from google.cloud import bigquery
+
+        return bigquery.QueryJobConfig(
+            query_parameters=[query_parameter(name, value) for name, value in (params or {}).items()]
+        )
+
+    def query(self, sql, params=None):
+        return self.client.query(sql, job_config=self.job_config(params)).to_dataframe()
+
+    def download(self, name, sql, params=None, categorical=()):
+        return streaming.download(self.client, sql, self.job_config(params), name=name, categorical=categorical)
+
+    def versions(self, name, sql):
+        return self.table_versions(referenced_tables(sql))
+
+    def table_versions(self, tables):
+        # a metadata call per table: free, and much faster than any query
+        return {table: self.client.get_table(f"{PROJECT}.{DATASET}.{table}").modified.isoformat() for table in tables}
+
+
+def query_parameter(name, value):
+    from google.cloud import bigquery
+
+    if isinstance(value, (bool, np.bool_)):
+        return bigquery.ScalarQueryParameter(name, "BOOL", bool(value))
+    if isinstance(value, (int, np.integer)):
+        return bigquery.ScalarQueryParameter(name, "INT64", int(value))
+    if isinstance(value, (float, np.floating)):
+        return bigquery.ScalarQueryParameter(name, "FLOAT64", float(value))
+    return bigquery.ScalarQueryParameter(name, "STRING", value)
+
+
+def table_files(directory):
+    """Table name -> path for every .parquet / .csv file in ``directory``."""
+    return {path.stem: path for path in sorted(Path(directory).glob("*")) if path.suffix in (".parquet", ".csv")}
+
+
+def read_table(path):
+    return pq.read_table(path) if path.suffix == ".parquet" else pacsv.read_csv(path)
+
+
+class DuckDBSource:
+    """Runs the BigQuery SQL against local tables, registered under the same ``data342.israel`` names."""
+
+    supports_sql = True
+
+    def __init__(self, data_dir=DATA_DIR):
+        try:
+            import duckdb
+            import sqlglot  # noqa: F401 -- needed by bigquery_to_duckdb
+        except ImportError as exc:
+            raise RuntimeError("the duckdb source needs `pip install duckdb sqlglot`") from exc
+        self.location = f"duckdb:{Path(data_dir).resolve()}"
+        self.connection = duckdb.connect()
+        self.connection.execute(f"ATTACH ':memory:' AS {PROJECT}")
+        self.connection.execute(f"CREATE SCHEMA {PROJECT}.{DATASET}")
+        self.tables = table_files(Path(data_dir) / "tables")
+        for table, path in self.tables.items():
+            reader = "read_parquet" if path.suffix == ".parquet" else "read_csv_auto"
+            self.connection.execute(
+                f"CREATE VIEW {PROJECT}.{DATASET}.{table} AS SELECT * FROM {reader}('{path}')"
+            )
+
+    def _batches(self, sql, params):
+        """The result's batches and its schema, which an empty result has no batches to carry."""
+        # a cursor per call: DuckDB connections aren't meant to be shared between threads
+        cursor = self.connection.cursor()
+        reader = cursor.execute(bigquery_to_duckdb(sql), params or {}).fetch_record_batch()
+        schema = pa.schema([pa.field(field.name, normalize_type(field.type)) for field in reader.schema])
+        return [normalize_batch(batch) for batch in reader], schema
+
+    def query(self, sql, params=None):
+        batches, schema = self._batches(sql, params)
+        return streaming.frame_from_batches(batches, schema=schema)
+
+    def download(self, name, sql, params=None, categorical=()):
+        batches, schema = self._batches(sql, params)
+        return streaming.frame_from_batches(batches, categorical, schema=schema)
+
+    def versions(self, name, sql):
+        return self.table_versions(referenced_tables(sql))
+
+    def table_versions(self, tables):
+        # the path too, so the same table name in another DASHBOARD_DATA_DIR is a different version
+        return {table: [str(self.tables[table].resolve()), self.tables[table].stat().st_mtime_ns] for table in tables}
+
+
+@functools.lru_cache(maxsize=256)
+def bigquery_to_duckdb(sql):
+    import sqlglot
+
+    return sqlglot.transpile(sql, read="bigquery", write="duckdb")[0]
+
+
+def normalize_type(type_):
+    """The INT64 / FLOAT64 type BigQuery would return for one of DuckDB's HUGEINT sums (Arrow decimals)."""
+    if pa.types.is_decimal(type_):
+        return pa.int64() if type_.scale == 0 else pa.float64()
+    return type_
+
+
+def normalize_batch(batch):
+    columns = [column.cast(normalize_type(column.type)) for column in batch.columns]
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+
+class FileSource:
+    """Serves whole precomputed result sets; the SQL is ignored."""
+
+    supports_sql = False
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.location = f"files:{Path(data_dir).resolve()}"
+        self.files = table_files(data_dir)
+
+    def query(self, sql, params=None):
+        raise NotImplementedError("the files source only serves whole datasets, use DASHBOARD_SOURCE=duckdb")
+
+    def download(self, name, sql, params=None, categorical=()):
+        if params:
+            raise NotImplementedError("the files source cannot filter a dataset")
+        if name not in self.files:
+            raise FileNotFoundError(f"no {name}.parquet or {name}.csv in the data directory")
+        table = read_table(self.files[name])
+        return streaming.frame_from_batches(table.to_batches(), categorical, schema=table.schema)
+
+    def versions(self, name, sql):
+        path = self.files.get(name)
+        return {name: [str(path.resolve()), path.stat().st_mtime_ns] if path else None}
+
+
+SOURCES = {"bigquery": BigQuerySource, "duckdb": DuckDBSource, "files": FileSource}
+
+
+def from_environment():
+    if SOURCE not in SOURCES:
+        raise ValueError(f"DASHBOARD_SOURCE must be one of {', '.join(SOURCES)}, not {SOURCE!r}")
+    return SOURCES[SOURCE]() if SOURCE == "bigquery" else SOURCES[SOURCE](DATA_DIR)
@@ -0,0 +1,143 @@
+"""Prepared datasets shared by every dashboard process on a host.
+
+The first process to prepare a dataset writes it to
+``<STORE_DIR>/<name>.<version>.arrow`` as an Arrow IPC file. It then points
+``<name>.current.json`` at that file. Every process, including the writer,
+memory-maps the current file read-only, and its numeric columns and
+categorical codes become DataFrame views of the mapped pages. N replicas
+therefore share one copy of the data in the page cache instead of holding N
+private ones.
+
+A refresh writes a new version and swaps the pointer with ``os.replace``, so a
+reader sees either the old version or the new one. Processes that still map
+an older file keep using it until their own next load. Only the last
+KEEP_VERSIONS files are kept on disk. The frame's ``attrs`` (fetch time,
+version) travel in the file's schema metadata.
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+try:
+    import fcntl
+except ImportError:  # Windows: processes that race each prepare their own copy
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = Path(os.environ.get("DASHBOARD_STORE_DIR", Path(__file__).parent / ".store"))
+KEEP_VERSIONS = 2
+META_KEY = b"dashboard_store"
+
+
+def pointer_path(name):
+    return STORE_DIR / f"{name}.current.json"
+
+
+def current(name):
+    """The pointer to ``name``'s current file, or None if it was never published."""
+    try:
+        return json.loads(pointer_path(name).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def read(name, max_age=None, key=None):
+    """Memory-map the current version of ``name``, or None if there is none, it was built
+    for a different ``key`` or it was fetched over ``max_age`` seconds ago."""
+    pointer = current(name)
+    if pointer is None or pointer.get("key") != key:
+        return None
+    if max_age is not None and time.time() - pointer["fetched_at"] > max_age:
+        return None
+    try:
+        table = ipc.open_file(pa.memory_map(str(STORE_DIR / pointer["file"]))).read_all()
+    except (OSError, pa.ArrowInvalid):  # e.g. cleaned up between reading the pointer and opening it
+        return None
+    # split_blocks keeps each column its own array, so they can stay views of the map
+    df = table.to_pandas(split_blocks=True)
+    df.attrs = json.loads((table.schema.metadata or {}).get(META_KEY, b"{}"))
+    return df
+
+
+def publish(name, df, key=None):
+    """Write ``df`` as the new current version of ``name`` and return the pointer."""
+    version = f"{time.time_ns():x}"
+    path = STORE_DIR / f"{name}.{version}.arrow"
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), META_KEY: json.dumps(df.attrs)})
+    pointer = {"file": path.name, "version": version, "key": key, "fetched_at": df.attrs.get("fetched_at", time.time())}
+
+    STORE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".arrow.tmp")
+    with pa.OSFile(str(tmp), "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+    tmp = pointer_path(name).with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(pointer))
+    os.replace(tmp, pointer_path(name))  # the swap
+    remove_old_versions(name)
+    return pointer
+
+
+def remove_old_versions(name):
+    # mapped files stay readable after unlinking, so this never pulls data out from under a reader
+    versions = sorted(STORE_DIR.glob(f"{name}.*.arrow"), key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in versions[KEEP_VERSIONS:]:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+@contextmanager
+def build_lock(name):
+    """Hold a per-dataset file lock, so one process on the host prepares it while the others wait."""
+    lock = None
+    if fcntl is not None:
+        try:
+            STORE_DIR.mkdir(parents=True, exist_ok=True)
+            lock = open(STORE_DIR / f"{name}.lock", "w")
+        except OSError:
+            pass
+    if lock is None:
+        yield
+        return
+    with lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def shared_frame(name, max_age, build, key=None, reuse=True):
+    """Map ``name`` from the store if it was fetched within ``max_age`` seconds, otherwise ``build()`` and publish it.
+
+    ``key`` identifies what produced the frame (say, a hash of its query), so a
+    stored version built from something else is never served. With ``reuse``
+    false the stored version is always rebuilt. Falls back to the built frame,
+    unshared, if the store directory can't be written.
+    """
+    df = read(name, max_age, key) if reuse else None
+    if df is not None:
+        return df
+    with build_lock(name):
+        df = read(name, max_age, key) if reuse else None  # another process may have published while we waited
+        if df is not None:
+            return df
+        built = build()
+        try:
+            publish(name, built, key)
+        except OSError:
+            logger.warning("could not publish %s to %s, keeping a private copy", name, STORE_DIR, exc_info=True)
+            return built
+    # map the published file, so this process drops its private copy too
+    df = read(name, key=key)
+    return built if df is None else df
@@ -0,0 +1,88 @@
+"""Download query results as a stream of Arrow record batches.
+
+``to_dataframe()`` pages rows through the REST API as Python objects and only
+then converts them. Here each batch arrives as Arrow, through the BigQuery
+Storage Read API when ``google-cloud-bigquery-storage`` is installed and REST
+pages otherwise. Selected string columns are dictionary-encoded batch by batch,
+so they land in pandas as categoricals without an object-dtype detour.
+"""
+import functools
+import logging
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+logger = logging.getLogger(__name__)
+
+# BigQuery's own to_dataframe() defaults, so switching download paths doesn't change dtypes
+PANDAS_TYPES = {
+    pa.int64(): pd.Int64Dtype(),
+    pa.bool_(): pd.BooleanDtype(),
+}
+
+_progress = {}  # name -> (rows received, total rows)
+_progress_lock = threading.Lock()
+
+
+@functools.cache
+def bqstorage_client():
+    try:
+        from google.cloud import bigquery_storage
+    except ImportError:
+        logger.info("google-cloud-bigquery-storage not installed, streaming over REST")
+        return None
+    return bigquery_storage.BigQueryReadClient()
+
+
+def progress(name):
+    """Rows received so far and the expected total for ``name``, or None before it starts."""
+    with _progress_lock:
+        return _progress.get(name)
+
+
+def is_text(type_):
+    return pa.types.is_string(type_) or pa.types.is_large_string(type_)
+
+
+def encode_batch(batch, categorical):
+    columns = [
+        pc.dictionary_encode(column) if name in categorical and is_text(column.type) else column
+        for name, column in zip(batch.schema.names, batch.columns)
+    ]
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+
+def record_batches(rows, name=None):
+    """Yield the batches of a finished query's RowIterator, recording progress under ``name``."""
+    received = 0
+    for batch in rows.to_arrow_iterable(bqstorage_client=bqstorage_client()):
+        received += batch.num_rows
+        if name is not None:
+            with _progress_lock:
+                _progress[name] = (received, rows.total_rows)
+        yield batch
+
+
+def frame_from_batches(batches, categorical=(), columns=(), schema=None):
+    """Decode record batches into one DataFrame, dictionary-encoding ``categorical`` as they go.
+
+    An empty result still gets its columns: typed from the Arrow ``schema`` if
+    there is one, otherwise just named after ``columns``.
+    """
+    batches = [encode_batch(batch, categorical) for batch in batches]
+    if not batches and schema is not None:
+        df = schema.empty_table().to_pandas(types_mapper=PANDAS_TYPES.get)
+        return df.astype({column: "category" for column in categorical if column in df.columns})
+    if not batches:
+        return pd.DataFrame(columns=list(columns))
+    # each batch built its own dictionaries; merge them so every column becomes a single categorical
+    table = pa.Table.from_batches(batches).unify_dictionaries()
+    return table.to_pandas(types_mapper=PANDAS_TYPES.get)
+
+
+def download(client, sql, job_config=None, name=None, categorical=()):
+    """Run ``sql`` and decode its batches as they arrive into one DataFrame."""
+    rows = client.query(sql, job_config=job_config).result()
+    return frame_from_batches(record_batches(rows, name), categorical, [field.name for field in rows.schema])
@@ -1,105 +1,191 @@
 
+import os
+import time
+
 import streamlit as st
 import pandas as pd
 import numpy as np
-from google.cloud import bigquery
 import plotly.express as px
 
-#%%
-client = bigquery.Client()
-
-query = """
-SELECT Country_Name, Fiscal_Year, Current_Dollar_Amount, Activity_Name, Activity_Description,
-Funding_Agency_Name, Foreign_Assistance_Objective_Name, International_Purpose_Name
-, International_Category_Name, International_Sector_Name
-FROM `data342.israel.trunc3`
-WHERE Transaction_Type_Name = "Disbursements"
---GROUP BY Country_Name, Fiscal_Year
-ORDER BY Fiscal_Year DESC
-"""
-
-query_political = """
-SELECT *
-FROM `data342.israel.violence_combined`
-order by Year
-"""
-
-query_civilian = """
-SELECT *
-FROM `data342.israel.civilian_combined`
-order by Year
-"""
-
-query_healthcare = """
-SELECT Country,  sum(`Number of Attacks on Health Facilities Reporting Damaged`) as healthcare_facilities_damanged,
- sum(`Occupation of Health Facility`) as healthcare_facilities_occupied, 
- sum(`Health Transportation Damaged`) as health_transportation_damanged, 
- sum(`Looting of Health Supplies`) as health_supplies_looted, 
- SUM(SAFE_CAST(`Health Workers Killed` AS INT64)) AS health_workers_killed, 
- sum(safe_cast(`Health Workers Injured` as int64)) as health_workers_injured, 
- count(distinct `Weapon Used` ) as weapons_used
-FROM `data342.israel.health` 
-group by 1 
-"""
-query_weapons = """
-SELECT 
-    Country, 
-    `Weapon Used` AS weapon_used, 
-    COUNT(*) AS weapon_usage_count, 
-    `Location of Incident` AS incident_location, 
-    COUNT(*) AS attack_count
-FROM `data342.israel.health`
-GROUP BY Country, `Weapon Used`, `Location of Incident`
-ORDER BY Country, weapon_usage_count DESC, attack_count DESC;
-"""
-@st.cache_data  # Caches results to improve performance
-def load_data1():
-    return client.query(query).to_dataframe()
-df = load_data1()
-
-@st.cache_data 
-def load_data2():
-    return client.query(query_political).to_dataframe()
-df_political = load_data2()
-
-@st.cache_data 
-def load_data3():
-    return client.query(query_civilian).to_dataframe()
-df_civilian = load_data3()
-
-@st.cache_data 
-def load_data4():
-    return client.query(query_healthcare).to_dataframe()
-df_health = load_data4()
-
-@st.cache_data 
-def load_data5():
-    return client.query(query_weapons).to_dataframe()
-df_weapons = load_data5()
-
-df["Country_Name"] = df["Country_Name"].replace("West Bank and Gaza", "Palestine")
-st.title("Israel Palestine Conflict Dashboard 🌍")
-st.write("This dashboard displays US foreign aid trends related to Israel, Palestine and ")
-
-col1, col2, col3, col4 = st.columns(4)
-with col1:
-    country = st.selectbox("Select a Country", ["All"] + sorted(df["Country_Name"].unique()))
+import aid
+import downsample
+import figures
+import health
+import instrumentation
+import loaders
+import prepare
+import refresh
+import snapshots
+import store
+import sources
+import streaming
+import timeline
+from queries import query, query_conflict, query_health
 
-with col2:
-    year = st.selectbox("Select a Year", ["All"] + sorted(df["Fiscal_Year"].unique(), reverse=True))
-
-with col3:
-    category = st.selectbox("Select a Funding Agency", ["All"] + sorted(df["Funding_Agency_Name"].unique()))
-
-filtered_df = df.copy()
-if country != "All":
-    filtered_df = filtered_df[filtered_df["Country_Name"] == country]
-if year != "All":
-    filtered_df = filtered_df[filtered_df["Fiscal_Year"] == year]
-if category != "All":
-    filtered_df = filtered_df[filtered_df["Funding_Agency_Name"] == category]
+#%%
+# compute section 1's aggregates in SQL instead of holding every aid row in memory
+AID_PUSHDOWN = os.environ.get("DASHBOARD_AID_PUSHDOWN", "") == "1"
+
+@st.cache_resource
+def data_source():
+    return sources.from_environment()
+
+def fetch_dataset(name, sql, categorical=(), watermark=None, max_age=snapshots.MAX_AGE):
+    source = data_source()
+    def fetch(sql, params=None):
+        return source.download(name, sql, params, categorical)
+    if not source.supports_sql:  # precomputed result files are already on disk, snapshotting them buys nothing
+        df = fetch(sql)
+        df.attrs["fetched_at"] = time.time()
+    else:
+        df = snapshots.cached_query(
+            name, sql, fetch, max_age, watermark=watermark,
+            table_versions=lambda: source.versions(name, sql), location=source.location,
+        )
+        df.attrs["fetched_at"] = (snapshots.read_meta(name) or {}).get("fetched_at", time.time())
+    df.attrs["version"] = time.time_ns()  # changes whenever the data is reloaded, see prepare.dataset_stamp
+    return df
+
+def shared_dataset(name, sql, max_age, prepare_frame):
+    """The prepared frame for ``name``, mapped from the host-wide store and only fetched and prepared if it is missing or too old."""
+    # the data behind the query is part of the key, so another DASHBOARD_DATA_DIR, regenerated
+    # files or changed tables never map a frame prepared from something else
+    source = data_source()
+    versions = snapshots.current_versions(name, lambda: source.versions(name, sql))
+    key = f"{source.location}:{snapshots.content_key(sql, versions) or snapshots.query_hash(sql)}"
+    # DASHBOARD_FULL_RELOAD must refetch, not map the frame prepared before the restart
+    return store.shared_frame(name, max_age, lambda: prepare_frame(max_age), key, reuse=not snapshots.FULL_RELOAD)
+
+# every loader takes the data age it will accept: the first load serves a fresh
+# snapshot, the background refresh only what was fetched within its window.
+# aid and conflict tables only grow at the end, so once stale they are topped up from
+# their latest fiscal year / year instead of refetched in full
+def load_data1(max_age):
+    return fetch_dataset("aid", query, prepare.AID_CATEGORICAL_COLUMNS, watermark="Fiscal_Year", max_age=max_age)
+
+def typed_aid(max_age):
+    raw = load_data1(max_age)
+    df = prepare.typed_aid(raw)
+    df.attrs["memory"] = prepare.memory_report(raw, df)
+    return df
+
+# both conflict tables in one query, stored dated and melted into chart lines; the
+# line positions and running totals are found per process on top of the mapped frame
+def load_data2(max_age):
+    return timeline.ConflictData(shared_dataset("conflict", query_conflict, max_age, lambda max_age: prepare.long_conflict(
+        fetch_dataset("conflict", query_conflict, watermark="Year", max_age=max_age))))
+
+# the frames are shared by every session (and mapped read-only), so they are
+# finished here and never changed by the page
+def renamed_opt(df):
+    df["Country"] = df["Country"].replace("OPT", "Palestine")
+    return df
+
+# one scan of the health table feeds both section 3 charts, rolled up per process like the aid data
+def load_data4(max_age):
+    return health.HealthData(shared_dataset("health", query_health, max_age, lambda max_age: renamed_opt(
+        fetch_dataset("health", query_health, max_age=max_age))))
+
+# the aggregate cube and filter index are built per process on top of the mapped frame
+def frame_aid_data(max_age):
+    df = shared_dataset("aid", query, max_age, typed_aid)
+    aid_data = aid.FrameAidData(df)
+    aid_data.memory = df.attrs.get("memory")
+    return aid_data
+
+# shared by every session, so one visitor's charts are warm for the next
+@st.cache_resource
+def figure_cache():
+    return figures.FigureCache()
+
+def format_month(label):
+    return pd.Timestamp(label).strftime("%b %Y")
+
+def month_range(totals, label, key):
+    return st.select_slider(label, totals.labels, value=(totals.labels[0], totals.labels[-1]), format_func=format_month, key=key)
+
+# holds the current version of every dataset and reloads each one in the background
+# before it goes stale, so after warm-up no visitor waits on the source
+@st.cache_resource
+def refresher():
+    return refresh.Refresher({
+        name: loader
+        for name, loader in [
+            ("aid", frame_aid_data),
+            ("conflict", load_data2),
+            ("health", load_data4),
+        ]
+        if not (AID_PUSHDOWN and name == "aid")
+    })
+
+@st.cache_resource
+def pushdown_aid_data():
+    source = data_source()
+    return aid.PushdownAidData(source.query, versions=lambda: source.versions("aid", query), max_age=snapshots.MAX_AGE)
+
+if AID_PUSHDOWN and not data_source().supports_sql:
+    st.error("DASHBOARD_AID_PUSHDOWN needs a source that runs SQL (bigquery or duckdb)")
+    st.stop()
+
+dataset_loaders = {name: (lambda name=name: refresher().get(name)) for name in refresher().loaders}
+
+# pages and the datasets each one reads
+PAGES = {
+    "Foreign aid": ["aid"],
+    "Conflict timeline": ["conflict"],
+    "Healthcare attacks": ["health"],
+}
 
-total_aid_current = filtered_df["Current_Dollar_Amount"].sum()
+trace = instrumentation.Trace(instrumentation.ENABLED or st.query_params.get("debug") == "1")
+
+def show_load_report():
+    load_report.wait_all()
+    with st.sidebar.expander("Data loading"):
+        st.dataframe(pd.DataFrame(load_report.timing_rows()), hide_index=True)
+        if "aid" in load_report.frames and load_report.frames["aid"].memory:
+            memory = load_report.frames["aid"].memory
+            st.caption(f"Aid table: {memory['before_mb']:,.1f} MB as plain strings, {memory['after_mb']:,.1f} MB typed")
+        st.dataframe(pd.DataFrame(refresher().stats()), hide_index=True)
+        if AID_PUSHDOWN:
+            pushdown = pushdown_aid_data()
+            st.caption(f"Aid queries: {pushdown.hits:,} cached, {pushdown.misses:,} run, "
+                       f"{pushdown.flight.stats()['coalesced']:,} coalesced")
+        cache = figure_cache().stats()
+        st.caption(f"Figure cache: {cache['hits']:,} hits, {cache['misses']:,} misses, "
+                   f"{cache['figures']} figures in {cache['mb']} of {cache['budget_mb']} MB")
+
+def dataset(name, section):
+    """Wait for one dataset, showing how many rows have arrived, and stop here if it failed."""
+    with trace.stage(section, f"wait for {name}"):
+        wait_for(name)
+    try:
+        return load_report.result(name)
+    except Exception as error:
+        st.error(f"Could not load the {name} dataset: {error}")
+        show_load_report()
+        st.stop()
+
+def wait_for(name):
+    if not load_report.done(name):
+        with st.spinner(f"Loading {name} data..."):
+            bar = st.empty()
+            while not load_report.wait(name, timeout=0.25):
+                received = streaming.progress(name)
+                if received and received[1]:
+                    bar.progress(min(received[0] / received[1], 1.0), text=f"{received[0]:,} of {received[1]:,} rows")
+            bar.empty()
+
+def show_trace():
+    if trace.enabled:
+        with st.sidebar.expander("Rerun timings", expanded=True):
+            st.dataframe(pd.DataFrame(trace.table()), hide_index=True)
+            st.caption(f"Appended to {instrumentation.TRACE_FILE}")
+    trace.close()
+
+def fragment_trace():
+    # a fragment rerun keeps the finished full run's globals, so it starts its own trace
+    # rather than growing that run's records under its run id
+    return trace.for_fragment()
 
 def format_large_number(value):
     if value >= 1_000_000_000:  # 
@@ -108,332 +194,412 @@ def format_large_number(value):
         return f"${value / 1_000_000:.2f}M"
     else:  # 
         return f"${value:,.2f}"
+
+def format_large_numbers(values):
+    """format_large_number over a whole column, with array and string ops instead of a Python call per row."""
+    values = np.asarray(values, dtype=float)
+    formatted = np.where(
+        values >= 1_000_000_000,
+        np.char.mod("$%.2fB", values / 1_000_000_000),
+        np.char.mod("$%.2fM", values / 1_000_000),
+    ).astype(object)
+    small = ~(values >= 1_000_000)  # NaN included, as in format_large_number
+    # %-formatting has no thousands separators, so a comma goes after every digit followed by whole groups of three
+    plain = pd.Series(np.char.mod("$%.2f", values[small]), dtype=object)
+    formatted[small] = plain.str.replace(r"(\d)(?=(?:\d{3})+\.)", r"\1,", regex=True).to_numpy()
+    return formatted
     
 ###########========================================================
-st.markdown("### 1. Key US Foreign Aid Figures ")
-kpi_col1, kpi_col2 = st.columns(2)
-
-if country == "Israel":
-    country_color = "steelblue" 
-elif country == "West Bank and Gaza":
-    country_color = "salmon"  
-else:
-    country_color = "white" 
-
-with kpi_col1:
-    st.markdown(f"<h2 style='color:{country_color};'>{country if country != 'All' else 'All Countries'}</h2>", unsafe_allow_html=True)
-
-with kpi_col2:
-    st.metric(
-        label="Total Aid (USD)",
-        value=format_large_number(total_aid_current)
-    )
-
-st.dataframe(filtered_df.drop(columns=["Country_Name"]))
-graph_df = df.copy() 
-if country != "All":
-    graph_df = graph_df[graph_df["Country_Name"] == country]
-if category != "All":
-    graph_df = graph_df[graph_df["Funding_Agency_Name"] == category]
-color_map = {
-    "Israel": "steelblue",  
-    "Gaza": "salmon", 
-}
-graph_df["color"] = graph_df["Country_Name"].map(color_map).fillna("gray")  # Default Gray for others
+# each section is a fragment, so its widgets rerun only that section instead of the whole page
+@st.fragment
+def aid_section(aid_data):
+    trace = fragment_trace()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        country = st.selectbox("Select a Country", ["All"] + aid_data.countries(), key="aid_country")
+
+    with col2:
+        year = st.selectbox("Select a Year", ["All"] + aid_data.years(), key="aid_year")
+
+    with col3:
+        category = st.selectbox("Select a Funding Agency", ["All"] + aid_data.agencies(), key="aid_agency")
+
+    with trace.stage("Foreign aid", "total"):
+        total_aid_current = aid_data.total(country, year, category)
+
+    st.markdown("### 1. Key US Foreign Aid Figures ")
+    kpi_col1, kpi_col2 = st.columns(2)
+
+    if country == "Israel":
+        country_color = "steelblue" 
+    elif country == "West Bank and Gaza":
+        country_color = "salmon"  
+    else:
+        country_color = "white" 
+
+    with kpi_col1:
+        st.markdown(f"<h2 style='color:{country_color};'>{country if country != 'All' else 'All Countries'}</h2>", unsafe_allow_html=True)
+
+    with kpi_col2:
+        st.metric(
+            label="Total Aid (USD)",
+            value=format_large_number(total_aid_current)
+        )
+
+    # only one page of rows goes to the browser, however many match
+    detail_rows = aid_data.detail_rows(country, year, category)
+    detail_pages = max(1, -(-detail_rows // aid.PAGE_SIZE))
+    if st.session_state.get("detail_page", 1) > detail_pages:  # the filters changed under the current page
+        st.session_state["detail_page"] = 1
+    sort_col, order_col, page_col = st.columns([2, 1, 1])
+    with sort_col:
+        detail_sort = st.selectbox("Sort rows by", ["Table order"] + aid.DETAIL_SORT_COLUMNS, key="detail_sort")
+    with order_col:
+        detail_descending = st.toggle("Descending", key="detail_descending")
+    with page_col:
+        detail_page = st.number_input(f"Page (of {detail_pages}, {detail_rows:,} rows)", 1, detail_pages, key="detail_page")
+    with trace.stage("Foreign aid", "detail table") as stage:
+        st.dataframe(stage.frame(aid_data.detail(
+            country, year, category, detail_page,
+            sort=None if detail_sort == "Table order" else detail_sort, descending=detail_descending,
+        )))
+    color_map = {
+        "Israel": "steelblue",  
+        "Gaza": "salmon", 
+    }
+
+    def aid_timeline_figure():
+        with trace.stage("Foreign aid", "timeline") as stage:
+            graph_df = stage.frame(aid_data.timeline(country, category))
+
+
+        with trace.stage("Foreign aid", "px.line"):
+            return px.line(
+                graph_df, 
+                x="Fiscal_Year", 
+                y="Current_Dollar_Amount", 
+                color="Country_Name",
+                title=f"Foreign Aid Over Time ({country if country != 'All' else 'All Countries'})",
+                markers=True,
+                color_discrete_map=color_map 
+            )
+
+
+    # the charts are only rebuilt when their own widgets or their data changed
+    with trace.stage("Foreign aid", "figure"):
+        fig = figure_cache().get(("aid timeline", aid_data.version, country, category), aid_timeline_figure)
+
+
+    with trace.stage("Foreign aid", "plotly_chart"):
+        st.plotly_chart(fig)
 
-graph_df = graph_df.groupby(["Country_Name", "Fiscal_Year"], as_index=False).agg(
-    {"Current_Dollar_Amount": "sum"}
-)
+###########========================================================
+@st.fragment
+def funding_section(aid_data):
+    trace = fragment_trace()
+    st.markdown("### Funding Objectives breakdown 📊")
+    col3, col4, col5 = st.columns(3)
 
+    with col3:
+        selected_country_bar = st.selectbox("Select a Country for Bar Chart", ["All"] + aid_data.countries(), key="country_bar")
 
-fig = px.line(
-    graph_df, 
-    x="Fiscal_Year", 
-    y="Current_Dollar_Amount", 
-    color="Country_Name",
-    title=f"Foreign Aid Over Time ({country if country != 'All' else 'All Countries'})",
-    markers=True,
-    color_discrete_map=color_map 
-)
+    with col4:
+        selected_year_bar = st.selectbox("Select a Year for Bar Chart", ["All"] + aid_data.years(), key="year_bar")
 
+    with col5:
+        sort_variable = st.selectbox(
+            "Sort by",
+            aid.SORT_VARIABLES,
+            key="sort_by_bar"
+        )
 
-st.plotly_chart(fig)
-###########========================================================
-st.markdown("### Funding Objectives breakdown 📊")
-col3, col4, col5 = st.columns(3)
-
-with col3:
-    selected_country_bar = st.selectbox("Select a Country for Bar Chart", ["All"] + sorted(df["Country_Name"].unique()), key="country_bar")
-
-with col4:
-    selected_year_bar = st.selectbox("Select a Year for Bar Chart", ["All"] + sorted(df["Fiscal_Year"].unique(), reverse=True), key="year_bar")
-
-with col5:
-    sort_variable = st.selectbox(
-        "Sort by",
-        ["Foreign_Assistance_Objective_Name", "International_Purpose_Name"],
-        key="sort_by_bar"
-    )
-
-filtered_df_bar = df.copy()
-if selected_country_bar != "All":
-    filtered_df_bar = filtered_df_bar[filtered_df_bar["Country_Name"] == selected_country_bar]
-if selected_year_bar != "All":
-    filtered_df_bar = filtered_df_bar[filtered_df_bar["Fiscal_Year"] == selected_year_bar]
-
-
-bar_chart_df = filtered_df_bar.groupby(sort_variable, as_index=False).agg(
-    {"Current_Dollar_Amount": "sum"}
-).sort_values(by="Current_Dollar_Amount", ascending=True)
-color_arg = "Foreign_Assistance_Objective_Name" if sort_variable == "Foreign_Assistance_Objective_Name" else None
-color_map = {
-    "Economic": "#FFD700",  
-    "Military": "#008000",  
-}
+    color_arg = "Foreign_Assistance_Objective_Name" if sort_variable == "Foreign_Assistance_Objective_Name" else None
+    color_map = {
+        "Economic": "#FFD700",  
+        "Military": "#008000",  
+    }
 
 
-fig_bar = px.bar(
-    bar_chart_df,
-    x="Current_Dollar_Amount",
-    y=sort_variable,
-    orientation="h",
-    title=f"Total Foreign Aid by {sort_variable} ({selected_country_bar if selected_country_bar != 'All' else 'All Countries'}, {selected_year_bar if selected_year_bar != 'All' else 'All Years'})",
-    labels={"Current_Dollar_Amount": "Total Aid (USD)", sort_variable: sort_variable},
-    height=700,
-    color=color_arg,
-    color_discrete_map=color_map if color_arg else None
-)
+    def breakdown_figure():
+        with trace.stage("Funding objectives", "breakdown") as stage:
+            bar_chart_df = stage.frame(aid_data.breakdown(selected_country_bar, selected_year_bar, sort_variable))
 
+        with trace.stage("Funding objectives", "px.bar"):
+            return px.bar(
+                bar_chart_df,
+                x="Current_Dollar_Amount",
+                y=sort_variable,
+                orientation="h",
+                title=f"Total Foreign Aid by {sort_variable} ({selected_country_bar if selected_country_bar != 'All' else 'All Countries'}, {selected_year_bar if selected_year_bar != 'All' else 'All Years'})",
+                labels={"Current_Dollar_Amount": "Total Aid (USD)", sort_variable: sort_variable},
+                height=700,
+                color=color_arg,
+                color_discrete_map=color_map if color_arg else None
+            )
 
-st.plotly_chart(fig_bar)
 
+    with trace.stage("Funding objectives", "figure"):
+        fig_bar = figure_cache().get(
+            ("aid breakdown", aid_data.version, selected_country_bar, selected_year_bar, sort_variable), breakdown_figure
+        )
 
-st.markdown(f"### Top 10 Funding Activities ({selected_country_bar if selected_country_bar != 'All' else 'All Countries'}, {selected_year_bar if selected_year_bar != 'All' else 'All Years'})")
 
-funding_activity_df = filtered_df_bar.groupby(["Activity_Name", "Activity_Description"], as_index=False).agg(
-    {"Current_Dollar_Amount": "sum"}
-).sort_values(by="Current_Dollar_Amount", ascending=False).head(10)  # Get Top 10
+    with trace.stage("Funding objectives", "plotly_chart"):
+        st.plotly_chart(fig_bar)
 
-funding_activity_df["Current_Dollar_Amount"] = funding_activity_df["Current_Dollar_Amount"].apply(format_large_number)
-funding_activity_df.index = range(1, len(funding_activity_df) + 1)
-st.dataframe(funding_activity_df)
 
-###########========================================================
-st.markdown("### 2. Political events and fatalities timeline")  
+    st.markdown(f"### Top 10 Funding Activities ({selected_country_bar if selected_country_bar != 'All' else 'All Countries'}, {selected_year_bar if selected_year_bar != 'All' else 'All Years'})")
 
-df_political["date"] = pd.to_datetime(df_political["Year"].astype(str) + "-" + df_political["Month"], errors="coerce", format="%Y-%B")
-df_political = df_political.dropna(subset=["date"])
-df_political = df_political.sort_values("date")
-available_years = sorted(df_political["Year"].dropna().unique(), reverse=True)
-selected_year = st.selectbox("Select Year", ["All"] + list(available_years), key="year_selector")
+    with trace.stage("Funding objectives", "top activities") as stage:
+        # Get Top 10, precomputed per selection
+        funding_activity_df = stage.frame(aid_data.top_activities(selected_country_bar, selected_year_bar, 10))
 
-filtered_df2 = df_political.copy()
-if selected_year != "All":
-    filtered_df2 = filtered_df2[filtered_df2["Year"] == selected_year]
+        funding_activity_df = funding_activity_df.assign(
+            Current_Dollar_Amount=format_large_numbers(funding_activity_df["Current_Dollar_Amount"])
+        )
+        funding_activity_df.index = range(1, len(funding_activity_df) + 1)
+    st.dataframe(funding_activity_df)
 
+###########========================================================
+@st.fragment
+def political_section(conflict):
+    trace = fragment_trace()
+    political_totals = conflict.totals["political"]
+    start, end = month_range(political_totals, "Select Months", "political_months")
 
-total_pse_fatalities = filtered_df2["pse_fatalities"].sum()
-total_israel_fatalities = filtered_df2["israel_fatalities"].sum()
+    with trace.stage("Political timeline", "totals"):
+        # differences of running totals, not a scan of the window's rows
+        total_pse_fatalities = political_totals.total("Palestine Fatalities", start, end)
+        total_israel_fatalities = political_totals.total("Israel Fatalities", start, end)
 
-st.markdown("### Total Fatalities Summary")
-col1, col2 = st.columns(2)
-with col1:
-    st.metric(label="Palestine Fatalities", value=f"{total_pse_fatalities:,}")
-with col2:
-    st.metric(label="Israel Fatalities", value=f"{total_israel_fatalities:,}")
+    st.markdown("### Total Fatalities Summary")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric(label="Palestine Fatalities", value=f"{total_pse_fatalities:,}")
+    with col2:
+        st.metric(label="Israel Fatalities", value=f"{total_israel_fatalities:,}")
 
 
 
-y_axis_option = st.selectbox("Select Metric", ["Events", "Fatalities"], key="y_axis_toggle")
+    y_axis_option = st.selectbox("Select Metric", ["Events", "Fatalities"], key="y_axis_toggle")
 
 
-y_variable_map = {
-    "Events": ["pse_events", "israel_events"],
-    "Fatalities": ["pse_fatalities", "israel_fatalities"]
-}
-y_columns = y_variable_map[y_axis_option]
+    def political_figure():
+        with trace.stage("Political timeline", "lines") as stage:
+            # stored melted, so this is a slice of the window's rows
+            df_melted = conflict.series("political", y_axis_option, start, end)
+            # at most CHART_POINTS per line; a narrower month range brings back every point
+            df_melted = stage.frame(downsample.downsample(df_melted, "date", "Count", by="Group"))
 
 
-df_melted = df_political.melt(id_vars=["date"], value_vars=y_columns, var_name="Group", value_name="Count")
+        with trace.stage("Political timeline", "px.line"):
+            return px.line(
+                df_melted,
+                x="date",
+                y="Count",
+                color="Group",
+                title=f"Political {y_axis_option} Over Time",
+                labels={"date": "Date", "Count": y_axis_option},
+                markers=True
+            )
 
-group_labels = {
-    "pse_events": "Palestine Events",
-    "israel_events": "Israel Events",
-    "pse_fatalities": "Palestine Fatalities",
-    "israel_fatalities": "Israel Fatalities"
-}
-df_melted["Group"] = df_melted["Group"].map(group_labels)
 
+    with trace.stage("Political timeline", "figure"):
+        fig2 = figure_cache().get(("political", conflict.version, y_axis_option, start, end), political_figure)
 
-fig2 = px.line(
-    df_melted,
-    x="date",
-    y="Count",
-    color="Group",
-    title=f"Political {y_axis_option} Over Time",
-    labels={"date": "Date", "Count": y_axis_option},
-    markers=True
-)
+    with trace.stage("Political timeline", "plotly_chart"):
+        st.plotly_chart(fig2)
 
-st.plotly_chart(fig2)
 ###########========================================================
+@st.fragment
+def civilian_section(conflict):
+    trace = fragment_trace()
+    civilian_totals = conflict.totals["civilian"]
+    political_totals = conflict.totals["political"]
+    start2, end2 = month_range(civilian_totals, "Select Months", "civilian_months")
 
-st.markdown("### Civilian targeting events and fatalities Summary")  
 
-df_civilian["date"] = pd.to_datetime(df_civilian["Year"].astype(str) + "-" + df_civilian["Month"], errors="coerce", format="%Y-%B")
-df_civilian = df_civilian.dropna(subset=["date"])
-df_civilian = df_civilian.sort_values("date")
-available_years2 = sorted(df_civilian["Year"].dropna().unique(), reverse=True)
-selected_year2 = st.selectbox("Select Year", ["All"] + list(available_years), key="year")
+    with trace.stage("Civilian timeline", "totals"):
+        total_pse_fatalities2 = civilian_totals.total("Palestine Fatalities", start2, end2)
+        total_israel_fatalities2 = civilian_totals.total("Israel Fatalities", start2, end2)
 
+        # the same window of all political fatalities
+        total_pse = political_totals.total("Palestine Fatalities", start2, end2)
+        total_israel = political_totals.total("Israel Fatalities", start2, end2)
 
-filtered_df3 = df_civilian.copy()
-if selected_year2 != "All":
-    filtered_df3 = filtered_df3[filtered_df3["Year"] == selected_year2]
+        israel_percentage = total_israel_fatalities2/total_israel
+        pse_percentage = total_pse_fatalities2/total_pse
 
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric(label="Palestine Fatalities", value=f"{total_pse_fatalities2:,}")
+    with col2:
+        st.metric(label = "Percentage", value = f"{pse_percentage:.2%}")    
+    with col3:
+        st.metric(label="Israel Fatalities", value=f"{total_israel_fatalities2:,}")
+    with col4:
+        st.metric(label = "Percentage", value = f"{israel_percentage:.2%}")
 
-total_pse_fatalities2 = filtered_df3["pse_fatalities"].sum()
-total_israel_fatalities2 = filtered_df3["israel_fatalities"].sum()
 
-if selected_year2 != "All":
-    total_pse = df_political[df_political["Year"] == selected_year2]["pse_fatalities"].sum()
-    total_israel = df_political[df_political["Year"] == selected_year2]["israel_fatalities"].sum()
-else :
-    total_pse = df_political["pse_fatalities"].sum()
-    total_israel = df_political['israel_fatalities'].sum()
+    y_axis_option2 = st.selectbox("Select Metric", ["Events", "Fatalities"], key="y_axis_toggle2")
 
-israel_percentage = total_israel_fatalities2/total_israel
-pse_percentage = total_pse_fatalities2/total_pse
 
-col1, col2, col3, col4 = st.columns(4)
-with col1:
-    st.metric(label="Palestine Fatalities", value=f"{total_pse_fatalities2:,}")
-with col2:
-    st.metric(label = "Percentage", value = f"{pse_percentage:.2%}")    
-with col3:
-    st.metric(label="Israel Fatalities", value=f"{total_israel_fatalities2:,}")
-with col4:
-    st.metric(label = "Percentage", value = f"{israel_percentage:.2%}")
+    def civilian_figure():
+        with trace.stage("Civilian timeline", "lines") as stage:
+            df_melted2 = conflict.series("civilian", y_axis_option2, start2, end2)
+            df_melted2 = stage.frame(downsample.downsample(df_melted2, "date", "Count", by="Group"))
 
+        with trace.stage("Civilian timeline", "px.line"):
+            return px.line(
+                df_melted2,
+                x="date",
+                y="Count",
+                color="Group",
+                title=f"Civilian {y_axis_option2} Over Time",
+                labels={"date": "Date", "Count": y_axis_option2},
+                markers=True
+            )
 
-y_axis_option2 = st.selectbox("Select Metric", ["Events", "Fatalities"], key="y_axis_toggle2")
 
-y_variable_map2 = {
-    "Events": ["pse_events", "israel_events"],
-    "Fatalities": ["pse_fatalities", "israel_fatalities"]
-}
-y_columns2 = y_variable_map2[y_axis_option2]
+    with trace.stage("Civilian timeline", "figure"):
+        fig3 = figure_cache().get(("civilian", conflict.version, y_axis_option2, start2, end2), civilian_figure)
 
-df_melted2 = df_civilian.melt(id_vars=["date"], value_vars=y_columns2, var_name="Group", value_name="Count")
+    with trace.stage("Civilian timeline", "plotly_chart"):
+        st.plotly_chart(fig3)
 
+###########========================================================
+@st.fragment
+def health_section(health_data):
+    trace = fragment_trace()
+    metric_options = {
+        "Health Workers Killed": "health_workers_killed",
+        "Health Workers Injured": "health_workers_injured",
+        "Healthcare Facilities Damaged": "healthcare_facilities_damanged",
+        "Healthcare Facilities Occupied": "healthcare_facilities_occupied",
+        "Health Transportation Damaged": "health_transportation_damanged",
+        "Health Supplies Looted": "health_supplies_looted"
 
-group_labels2 = {
-    "pse_events": "Palestine Events",
-    "israel_events": "Israel Events",
-    "pse_fatalities": "Palestine Fatalities",
-    "israel_fatalities": "Israel Fatalities"
-}
-df_melted2["Group"] = df_melted2["Group"].map(group_labels2)
+    }
 
-fig3 = px.line(
-    df_melted2,
-    x="date",
-    y="Count",
-    color="Group",
-    title=f"Civilian {y_axis_option2} Over Time",
-    labels={"date": "Date", "Count": y_axis_option2},
-    markers=True
-)
+    selected_metric = st.selectbox("Select Metric to Display", list(metric_options.keys()), key="health_metric_toggle")
 
-st.plotly_chart(fig3)
 
+    metric_column = metric_options[selected_metric]
+    st.write("Attack on healthcare facilities suffered by both sides from October 7th 2023 to September 2024") 
 
-###########========================================================
-st.markdown("### 3. Attack on healthcare facilities")
 
-df_health["Country"] = df_health["Country"].replace("OPT", "Palestine")  
+    def health_figure():
+        with trace.stage("Healthcare attacks", "totals") as stage:
+            df_pie = stage.frame(health_data.pie(metric_column))
 
+        with trace.stage("Healthcare attacks", "px.pie"):
+            fig_pie = px.pie(
+                df_pie,
+                names="Country",
+                values=metric_column,
+                title=f"{selected_metric} by Country",
+                color="Country",
+                color_discrete_map={"Israel": "steelblue", "Palestine": "salmon"}  #
+            )
+            fig_pie.update_traces(textinfo="label+value", textfont_size=14)
+        return fig_pie
 
-metric_options = {
-    "Health Workers Killed": "health_workers_killed",
-    "Health Workers Injured": "health_workers_injured",
-    "Healthcare Facilities Damaged": "healthcare_facilities_damanged",
-    "Healthcare Facilities Occupied": "healthcare_facilities_occupied",
-    "Health Transportation Damaged": "health_transportation_damanged",
-    "Health Supplies Looted": "health_supplies_looted"
 
-}
+    with trace.stage("Healthcare attacks", "figure"):
+        fig_pie = figure_cache().get(("health", health_data.version, selected_metric), health_figure)
 
-selected_metric = st.selectbox("Select Metric to Display", list(metric_options.keys()), key="health_metric_toggle")
+    with trace.stage("Healthcare attacks", "plotly_chart"):
+        st.plotly_chart(fig_pie)
 
+###########========================================================
+@st.fragment
+def weapons_section(health_data):
+    trace = fragment_trace()
+    category_options = {
+        "Weapons Used by perpetrator": ("weapon_used", "weapon_usage_count"),
+        "Location of Incident": ("incident_location", "attack_count")
+    }
+    selected_category = st.selectbox("Select Category to Compare", list(category_options.keys()), key="category_toggle")
+    selected_column, sum_column = category_options[selected_category]
+
+    color_map_last = {"Israel": "steelblue", "Palestine": "salmon"}
+
+
+    def weapons_figure(side):
+        with trace.stage("Weapons and locations", f"{side} top 5") as stage:
+            df_side = stage.frame(health_data.top_categories(selected_column, side))
+
+        with trace.stage("Weapons and locations", f"{side} px.bar"):
+            return px.bar(
+                df_side,
+                y=sum_column,
+                x=selected_column,
+               # orientation="h",
+                title=f"{side} - {selected_category}",
+                labels={sum_column: "Occurrences", selected_column: selected_category},
+                height=700,
+                color_discrete_sequence=[color_map_last[side]] 
+            )
+
+
+    col1, col2 = st.columns(2)
+    for side, column in [("Israel", col1), ("Palestine", col2)]:
+        with column, trace.stage("Weapons and locations", f"{side} chart"):
+            st.plotly_chart(figure_cache().get(
+                ("weapons", health_data.version, side, selected_category), lambda: weapons_figure(side)
+            ))
 
-metric_column = metric_options[selected_metric]
-df_pie = df_health.groupby("Country", as_index=False)[metric_column].sum()
-st.write("Attack on healthcare facilities suffered by both sides from October 7th 2023 to September 2024") 
 
+###########========================================================
+def aid_page():
+    if AID_PUSHDOWN:
+        aid_data = pushdown_aid_data()
+        aid_data.check_version()  # new trunc3 rows drop the cached results and their figures
+    else:
+        aid_data = dataset("aid", "Foreign aid")
+    aid_section(aid_data)
+    funding_section(aid_data)
 
-fig_pie = px.pie(
-    df_pie,
-    names="Country",
-    values=metric_column,
-    title=f"{selected_metric} by Country",
-    color="Country",
-    color_discrete_map={"Israel": "steelblue", "Palestine": "salmon"}  #
-)
-fig_pie.update_traces(textinfo="label+value", textfont_size=14)
+def conflict_page():
+    st.markdown("### 2. Political events and fatalities timeline")  
 
+    conflict = dataset("conflict", "Conflict timelines")
+    political_section(conflict)
 
+    st.markdown("### Civilian targeting events and fatalities Summary")  
 
-###########========================================================
-st.plotly_chart(fig_pie)
-st.markdown("### Location of incident / weapon used by attacker")
+    civilian_section(conflict)
 
+def health_page():
+    st.markdown("### 3. Attack on healthcare facilities")
 
-df_weapons["Country"] = df_weapons["Country"].replace("OPT", "Palestine")  # 
+    health_data = dataset("health", "Healthcare attacks")
+    health_section(health_data)
 
+    st.markdown("### Location of incident / weapon used by attacker")
 
-category_options = {
-    "Weapons Used by perpetrator": ("weapon_used", "weapon_usage_count"),
-    "Location of Incident": ("incident_location", "attack_count")
-}
-selected_category = st.selectbox("Select Category to Compare", list(category_options.keys()), key="category_toggle")
-selected_column, sum_column = category_options[selected_category]
-
-df_agg = df_weapons.groupby(["Country", selected_column], as_index=False).agg({sum_column: "sum"})
-
-df_israel = df_agg[df_agg["Country"] == "Israel"].sort_values(by=sum_column, ascending=False).head(5)
-df_palestine = df_agg[df_agg["Country"] == "Palestine"].sort_values(by=sum_column, ascending=False).head(5)
-
-
-col1, col2 = st.columns(2)
-color_map_last = {"Israel": "steelblue", "Palestine": "salmon"}
-with col1:
-    fig_israel = px.bar(
-        df_israel,
-        y=sum_column,
-        x=selected_column,
-       # orientation="h",
-        title=f"Israel - {selected_category}",
-        labels={sum_column: "Occurrences", selected_column: selected_category},
-        height=700,
-        color_discrete_sequence=[color_map_last["Israel"]] 
-    )
-    st.plotly_chart(fig_israel)
-
-with col2:
-    fig_palestine = px.bar(
-        df_palestine,
-        y=sum_column,
-        x=selected_column,
-        #orientation="h",
-        title=f"Palestine - {selected_category}",
-        labels={sum_column: "Occurrences", selected_column: selected_category},
-        height=700,
-        color_discrete_sequence=[color_map_last["Palestine"]]
-    )
-    st.plotly_chart(fig_palestine)
+    weapons_section(health_data)
+
+
+st.title("Israel Palestine Conflict Dashboard 🌍")
+st.write("This dashboard displays US foreign aid trends related to Israel, Palestine and ")
+
+page = st.radio("Section", list(PAGES), horizontal=True, key="page", label_visibility="collapsed")
+
+# only the open page's queries run up front, so first paint costs one page's data;
+# the other datasets are fetched in the background once those are in, which warms
+# their caches for when the user switches pages
+page_loaders = {name: dataset_loaders[name] for name in PAGES[page] if name in dataset_loaders}
+load_report = loaders.load_concurrently(page_loaders)
+if not st.session_state.get("prefetched"):
+    st.session_state["prefetched"] = True
+    loaders.prefetch({name: loader for name, loader in dataset_loaders.items() if name not in page_loaders}, after=load_report)
+
+{"Foreign aid": aid_page, "Conflict timeline": conflict_page, "Healthcare attacks": health_page}[page]()
 
 
+show_load_report()
+show_trace()
 
 '''
 Created by Kehan Zhao, Mar 2025
@@ -0,0 +1,123 @@
+"""Generate synthetic stand-ins for the dashboard's BigQuery tables.
+
+    python synthetic.py --scale 100 --out data
+
+writes ``data/tables/{trunc3,violence_combined,civilian_combined,health}.parquet``
+with the production column names for ``DASHBOARD_SOURCE=duckdb``. It also runs
+the dashboard's SQL over them and writes the three result sets to
+``data/<dataset>.parquet`` for ``DASHBOARD_SOURCE=files``. ``--scale 1`` is
+roughly the production size; row counts grow linearly with it.
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import queries
+import sources
+
+AID_ROWS = 20_000
+HEALTH_ROWS = 2_000
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October",
+          "November", "December"]
+COUNTRIES = ["Israel", "West Bank and Gaza", "Jordan", "Egypt", "Lebanon", "Syria"]
+AGENCIES = ["U.S. Agency for International Development", "Department of Defense", "Department of State",
+            "Department of Agriculture", "Department of Health and Human Services", "Peace Corps",
+            "Department of the Treasury", "Department of Energy"]
+WEAPONS = ["Aerial bomb", "Rocket", "Missile", "Gunfire", "Tear gas", "Shelling", "Explosive device", "Unknown"]
+LOCATIONS = ["Hospital", "Clinic", "Ambulance", "Health warehouse", "Primary care centre", "Road", "Unknown"]
+
+
+def words(rng, n, size):
+    vocabulary = np.array(["health", "security", "water", "governance", "education", "support", "program",
+                           "assistance", "training", "infrastructure", "emergency", "development", "economic",
+                           "military", "financing", "capacity", "services", "community", "relief", "systems"])
+    return [" ".join(rng.choice(vocabulary, size)) for _ in range(n)]
+
+
+def aid_table(rng, scale):
+    n = int(AID_ROWS * scale)
+    activities = max(50, int(500 * np.sqrt(scale)))  # more history brings new activities, sublinearly
+    activity_names = np.array([f"{name.title()} #{i}" for i, name in enumerate(words(rng, activities, 3))])
+    descriptions = np.array(words(rng, activities, 40))
+    activity = rng.integers(0, activities, n)
+    return pd.DataFrame({
+        "Country_Name": rng.choice(COUNTRIES, n, p=[0.45, 0.25, 0.12, 0.1, 0.05, 0.03]),
+        "Fiscal_Year": rng.integers(1946, 2025, n),
+        "Transaction_Type_Name": rng.choice(["Disbursements", "Obligations"], n, p=[0.7, 0.3]),
+        "Current_Dollar_Amount": rng.lognormal(11, 2.5, n).round(2),
+        "Activity_Name": activity_names[activity],
+        "Activity_Description": descriptions[activity],
+        "Funding_Agency_Name": rng.choice(AGENCIES, n),
+        "Foreign_Assistance_Objective_Name": rng.choice(["Economic", "Military"], n, p=[0.6, 0.4]),
+        "International_Purpose_Name": rng.choice([f"Purpose {i}" for i in range(40)], n),
+        "International_Category_Name": rng.choice([f"Category {i}" for i in range(10)], n),
+        "International_Sector_Name": rng.choice([f"Sector {i}" for i in range(30)], n),
+    })
+
+
+def conflict_table(rng, scale):
+    # one row per month in production; a larger scale adds rows per month, as finer-grained events would
+    per_month = max(1, int(scale))
+    periods = [(year, month) for year in range(2016, 2025) for month in MONTHS]
+    year, month = zip(*[period for period in periods for _ in range(per_month)])
+    n = len(year)
+    return pd.DataFrame({
+        "Year": np.array(year),
+        "Month": np.array(month),
+        "pse_events": rng.poisson(120, n),
+        "israel_events": rng.poisson(40, n),
+        "pse_fatalities": rng.poisson(60, n),
+        "israel_fatalities": rng.poisson(8, n),
+    })
+
+
+def health_table(rng, scale):
+    n = int(HEALTH_ROWS * scale)
+    # the casualty columns are free text upstream, hence SAFE_CAST in the query
+    casualties = lambda lam: np.where(rng.random(n) < 0.05, "unknown", rng.poisson(lam, n).astype(str))  # noqa: E731
+    return pd.DataFrame({
+        "Country": rng.choice(["OPT", "Israel"], n, p=[0.85, 0.15]),
+        "Weapon Used": rng.choice(WEAPONS, n),
+        "Location of Incident": rng.choice(LOCATIONS, n),
+        "Number of Attacks on Health Facilities Reporting Damaged": rng.poisson(0.6, n),
+        "Occupation of Health Facility": rng.poisson(0.1, n),
+        "Health Transportation Damaged": rng.poisson(0.3, n),
+        "Looting of Health Supplies": rng.poisson(0.05, n),
+        "Health Workers Killed": casualties(0.4),
+        "Health Workers Injured": casualties(0.8),
+    })
+
+
+def generate(out, scale=1.0, seed=0):
+    rng = np.random.default_rng(seed)
+    out = Path(out)
+    (out / "tables").mkdir(parents=True, exist_ok=True)
+    tables = {
+        "trunc3": aid_table(rng, scale),
+        "violence_combined": conflict_table(rng, scale),
+        "civilian_combined": conflict_table(rng, scale),
+        "health": health_table(rng, scale),
+    }
+    for name, df in tables.items():
+        df.to_parquet(out / "tables" / f"{name}.parquet", index=False)
+    # the files source serves query results, so run the dashboard's own SQL to produce them
+    source = sources.DuckDBSource(out)
+    for name, sql in queries.DATASETS.items():
+        source.download(name, sql).to_parquet(out / f"{name}.parquet", index=False)
+    return {name: len(df) for name, df in tables.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiple of the production row counts")
+    parser.add_argument("--out", default=str(sources.DATA_DIR), help="directory to write the tables to")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for name, rows in generate(args.out, args.scale, args.seed).items():
+        print(f"{name}: {rows:,} rows")
+
+
+if __name__ == "__main__":
+    main()
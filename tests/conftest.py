@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# appended rather than inserted: the app script is called streamlit.py, and it
+# must not shadow the streamlit package for anything that imports it
+sys.path.append(str(Path(__file__).resolve().parent.parent))
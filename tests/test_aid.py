@@ -0,0 +1,149 @@
+"""FrameAidData against the same answers computed with plain pandas on the typed frame."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import aid
+import prepare
+from aid import ALL, AMOUNT, SORT_VARIABLES, FrameAidData
+
+
+def raw_aid(n=600, seed=0):
+    rng = np.random.default_rng(seed)
+    def pick(values):
+        return rng.choice(np.array(values, dtype=object), n)
+    df = pd.DataFrame({
+        "Country_Name": pick(["Israel", "Jordan", "West Bank and Gaza", "Egypt", None]),
+        "Fiscal_Year": pick([2019, 2020, 2021, 2022, None]),
+        "Funding_Agency_Name": pick(["Department of State", "Peace Corps", "USAID", None]),
+        "Foreign_Assistance_Objective_Name": pick(["Military", "Economic", None]),
+        "International_Purpose_Name": pick([f"Purpose {i}" for i in range(6)] + [None]),
+        "Activity_Name": pick([f"Activity {i}" for i in range(25)] + [None]),
+        "Activity_Description": pick(["short", "long", None]),
+        # distinct amounts, so the largest-first and smallest-first orders have no ties
+        AMOUNT: rng.permutation(n) * 1000.0 + rng.random(n),
+    })
+    df.loc[rng.choice(n, 10, replace=False), AMOUNT] = np.nan
+    return df
+
+
+@pytest.fixture(scope="module")
+def df():
+    return prepare.typed_aid(raw_aid())
+
+
+@pytest.fixture(scope="module", params=["cube", "frame"])
+def data(request, df):
+    data = FrameAidData(df)
+    if request.param == "frame":
+        data.cube = None  # what a frame too large for the cube falls back to
+    return data
+
+
+SELECTIONS = [
+    (ALL, ALL, ALL),
+    ("Palestine", ALL, ALL),
+    (ALL, 2020, ALL),
+    (ALL, ALL, "Peace Corps"),
+    ("Israel", 2021, "Department of State"),
+    ("Syria", ALL, ALL),  # not in the data: an empty selection
+    ("Jordan", 1999, ALL),
+]
+
+
+def matching(df, country=ALL, year=ALL, agency=ALL):
+    mask = pd.Series(True, index=df.index)
+    for column, value in (("Country_Name", country), ("Fiscal_Year", year), ("Funding_Agency_Name", agency)):
+        if value != ALL:
+            mask &= df[column] == value
+    return df[mask]
+
+
+def plain(frame, keys):
+    """``frame`` with its key columns as plain objects, in key order, for comparing values across dtypes."""
+    frame = frame.astype({key: object for key in keys})
+    return frame.sort_values(keys, kind="stable").reset_index(drop=True)
+
+
+@pytest.mark.parametrize("country, year, agency", SELECTIONS)
+def test_total(data, df, country, year, agency):
+    assert data.total(country, year, agency) == pytest.approx(matching(df, country, year, agency)[AMOUNT].sum())
+
+
+@pytest.mark.parametrize("country, year, agency", SELECTIONS)
+def test_timeline(data, df, country, year, agency):
+    keys = ["Country_Name", "Fiscal_Year"]
+    expected = matching(df, country, ALL, agency).groupby(keys, observed=True)[AMOUNT].sum().reset_index()
+    result = data.timeline(country, agency)
+    pd.testing.assert_frame_equal(plain(result[[*keys, AMOUNT]], keys), plain(expected, keys), check_dtype=False)
+
+
+@pytest.mark.parametrize("sort_variable", SORT_VARIABLES)
+@pytest.mark.parametrize("country, year, agency", SELECTIONS)
+def test_breakdown(data, df, country, year, agency, sort_variable):
+    expected = matching(df, country, year).groupby(sort_variable, observed=True)[AMOUNT].sum().reset_index()
+    result = data.breakdown(country, year, sort_variable).reset_index(drop=True)
+    assert list(result[AMOUNT]) == pytest.approx(sorted(expected[AMOUNT]))
+    pd.testing.assert_frame_equal(plain(result, [sort_variable]), plain(expected, [sort_variable]), check_dtype=False)
+
+
+@pytest.mark.parametrize("n", [3, 10, 15])
+@pytest.mark.parametrize("country, year, agency", SELECTIONS)
+def test_top_activities(data, df, country, year, agency, n):
+    keys = ["Activity_Name", "Activity_Description"]
+    expected = matching(df, country, year).groupby(keys, observed=True)[AMOUNT].sum().reset_index()
+    expected = expected.sort_values(AMOUNT, ascending=False).head(n).reset_index(drop=True)
+    result = data.top_activities(country, year, n).reset_index(drop=True)
+    pd.testing.assert_frame_equal(result[[*keys, AMOUNT]].astype({key: object for key in keys}),
+                                  expected.astype({key: object for key in keys}), check_dtype=False)
+
+
+@pytest.mark.parametrize("country, year, agency", SELECTIONS)
+def test_detail_rows(data, df, country, year, agency):
+    assert data.detail_rows(country, year, agency) == len(matching(df, country, year, agency))
+
+
+def test_choices_leave_out_missing_values(data, df):
+    assert data.countries() == sorted(df["Country_Name"].dropna().unique())
+    assert "West Bank and Gaza" not in data.countries()
+    assert data.agencies() == sorted(df["Funding_Agency_Name"].dropna().unique())
+
+
+@pytest.mark.parametrize("sort, descending", [(None, False), ("Fiscal_Year", True), (AMOUNT, False),
+                                              (AMOUNT, True), ("Activity_Name", True)])
+@pytest.mark.parametrize("country, year, agency", SELECTIONS[:4])
+def test_detail_pages(data, df, country, year, agency, sort, descending, monkeypatch):
+    monkeypatch.setattr(aid, "PAGE_SIZE", 40)
+    expected = matching(df, country, year, agency)
+    if sort is not None:
+        expected = expected.sort_values(sort, ascending=not descending, kind="stable", na_position="last")
+    for page in (1, 2, len(expected) // 40 + 1):
+        result = data.detail(country, year, agency, page, sort, descending)
+        rows = expected.iloc[(page - 1) * 40:page * 40]
+        column = sort or AMOUNT
+        pd.testing.assert_series_equal(result[column].reset_index(drop=True), rows[column].reset_index(drop=True))
+
+
+@pytest.mark.parametrize("sort, descending", [(None, False), ("Fiscal_Year", False), ("Funding_Agency_Name", True)])
+def test_pushdown_pages_split_the_rows(tmp_path, monkeypatch, sort, descending):
+    pytest.importorskip("duckdb")
+    pytest.importorskip("sqlglot")
+    import sources
+    import synthetic
+
+    rng = np.random.default_rng(0)
+    table = synthetic.aid_table(rng, 0.01).head(300)
+    table["Fiscal_Year"] = rng.integers(2020, 2023, len(table))  # a few hundred rows per year
+    (tmp_path / "tables").mkdir()
+    table.to_parquet(tmp_path / "tables" / "trunc3.parquet", index=False)
+    data = aid.PushdownAidData(sources.DuckDBSource(tmp_path).query)
+    monkeypatch.setattr(aid, "PAGE_SIZE", 25)
+
+    expected = table[table["Transaction_Type_Name"] == "Disbursements"]
+    pages = [data.detail(ALL, ALL, ALL, page, sort, descending) for page in range(1, len(expected) // 25 + 2)]
+    rows = pd.concat(pages, ignore_index=True)
+    columns = list(rows.columns)
+    assert len(rows) == len(expected)
+    key = rows[sort or "Fiscal_Year"]
+    assert key.is_monotonic_decreasing if (descending or sort is None) else key.is_monotonic_increasing
+    pd.testing.assert_frame_equal(plain(rows, columns), plain(expected[columns], columns), check_dtype=False)
@@ -0,0 +1,70 @@
+"""LTTB against a plain-Python version of the algorithm, around the CHART_POINTS boundary."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from downsample import CHART_POINTS, downsample, lttb
+
+
+def reference_lttb(x, y, points):
+    """Largest-triangle-three-buckets as first published, one point at a time."""
+    n = len(x)
+    if points >= n or points < 3:
+        return list(range(n))
+    every = (n - 2) / (points - 2)
+    kept, a = [0], 0
+    for i in range(points - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        next_lo, next_hi = hi, min(int((i + 2) * every) + 1, n)
+        if i == points - 3:
+            next_lo, next_hi = n - 1, n
+        cx = sum(x[next_lo:next_hi]) / (next_hi - next_lo)
+        cy = sum(y[next_lo:next_hi]) / (next_hi - next_lo)
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((x[a] - cx) * (y[j] - y[a]) - (x[a] - x[j]) * (cy - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+    return kept + [n - 1]
+
+
+def series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.arange(n, dtype="float64"), np.cumsum(rng.normal(size=n))
+
+
+@pytest.mark.parametrize("n", [CHART_POINTS - 1, CHART_POINTS])
+def test_series_that_fit_are_untouched(n):
+    np.testing.assert_array_equal(lttb(*series(n)), np.arange(n))
+
+
+@pytest.mark.parametrize("n, points", [(CHART_POINTS + 1, CHART_POINTS), (CHART_POINTS + 2, CHART_POINTS),
+                                       (3 * CHART_POINTS + 7, CHART_POINTS), (10, 3), (11, 5)])
+def test_matches_reference(n, points):
+    x, y = series(n)
+    kept = lttb(x, y, points)
+    assert len(kept) == points
+    assert kept[0] == 0 and kept[-1] == n - 1
+    assert (np.diff(kept) > 0).all()
+    np.testing.assert_array_equal(kept, reference_lttb(list(x), list(y), points))
+
+
+def test_keeps_a_spike():
+    x, y = series(CHART_POINTS * 4)
+    y[1234] = 1e6
+    assert 1234 in lttb(x, y)
+
+
+def test_downsample_by_group():
+    dates = pd.date_range("1990-01-01", periods=CHART_POINTS + 1, freq="D")
+    df = pd.concat([
+        pd.DataFrame({"Group": "long", "date": dates, "Count": np.arange(len(dates))}),
+        pd.DataFrame({"Group": "short", "date": dates[:10], "Count": np.arange(10)}),
+    ], ignore_index=True)
+    thinned = downsample(df, "date", "Count", by="Group")
+    assert thinned["Group"].value_counts().to_dict() == {"long": CHART_POINTS, "short": 10}
+    assert thinned.index.is_monotonic_increasing
+    fits = df.iloc[:CHART_POINTS]
+    assert downsample(fits, "date", "Count", by="Group") is fits
@@ -0,0 +1,82 @@
+"""The filter and sort indexes against boolean masks and ``sort_values``."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from filter_index import ALL, FilterIndex, SortIndex, intersect_sorted
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_intersect_sorted(seed):
+    rng = np.random.default_rng(seed)
+    a = np.sort(rng.choice(200, rng.integers(0, 50), replace=False))
+    b = np.sort(rng.choice(200, rng.integers(0, 120), replace=False))
+    expected = np.intersect1d(a, b)
+    np.testing.assert_array_equal(intersect_sorted(a, b), expected)
+    np.testing.assert_array_equal(intersect_sorted(b, a), expected)
+
+
+def test_intersect_sorted_empty():
+    assert len(intersect_sorted(np.zeros(0, dtype=np.intp), np.arange(5))) == 0
+    assert len(intersect_sorted(np.arange(5), np.arange(5, 10))) == 0
+
+
+def frame(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "country": pd.Categorical(rng.choice(np.array(["Israel", "Jordan", "Egypt", None], dtype=object), n)),
+        "year": rng.choice([2020.0, 2021.0, 2022.0, np.nan], n),
+        "agency": rng.choice(np.array(["State", "USAID", None], dtype=object), n),
+    })
+
+
+@pytest.fixture(scope="module")
+def df():
+    return frame()
+
+
+@pytest.mark.parametrize("selection", [
+    {"country": "Israel"},
+    {"country": "Jordan", "year": 2021},
+    {"country": "Egypt", "year": 2020.0, "agency": "USAID"},
+    {"country": ALL, "year": 2022, "agency": ALL},
+    {"country": "Syria"},  # a value that never occurs
+    {"country": "Israel", "year": 1999},
+])
+def test_rows_match_a_mask(df, selection):
+    index = FilterIndex(df, list(df.columns))
+    mask = np.ones(len(df), dtype=bool)
+    for column, value in selection.items():
+        if value != ALL:
+            mask &= (df[column] == value).to_numpy()
+    np.testing.assert_array_equal(index.rows(**selection), np.flatnonzero(mask))
+    pd.testing.assert_frame_equal(index.select(**selection), df[mask])
+
+
+def test_all_selects_everything(df):
+    index = FilterIndex(df, list(df.columns))
+    assert index.rows(country=ALL, year=ALL, agency=ALL) is None
+    assert index.select(country=ALL, year=ALL) is df  # missing keys included
+
+
+def test_missing_keys_match_no_value(df):
+    index = FilterIndex(df, list(df.columns))
+    matched = np.concatenate([index.rows(country=value) for value in df["country"].cat.categories])
+    assert len(matched) == df["country"].notna().sum()
+    assert len(index.rows(year=np.nan)) == 0
+
+
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("column", ["country", "year", "agency"])
+@pytest.mark.parametrize("selection", [{}, {"agency": "State"}, {"country": "Syria"}])
+def test_order_matches_sort_values(df, column, descending, selection):
+    rows = FilterIndex(df, list(df.columns)).rows(**selection)
+    ordered = SortIndex(df).order(rows, column, descending)
+    subset = df if rows is None else df.take(rows)
+    expected = subset.sort_values(column, ascending=not descending, kind="stable", na_position="last")
+    # ties may come out in either order, so compare the sorted values and the set of rows
+    pd.testing.assert_series_equal(df[column].take(ordered).reset_index(drop=True),
+                                   expected[column].reset_index(drop=True))
+    assert sorted(ordered) == sorted(expected.index)
+    if not descending:
+        np.testing.assert_array_equal(ordered, expected.index)
@@ -0,0 +1,42 @@
+"""Incremental snapshot refreshes against the rows a full reload would return."""
+import pandas as pd
+import pytest
+
+import snapshots
+
+
+@pytest.fixture(autouse=True)
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, "SNAPSHOT_DIR", tmp_path)
+
+
+def refresh(old, new):
+    snapshots.write_snapshot("t", "SELECT 1", old, "Fiscal_Year", location="here")
+    return snapshots.refresh_incrementally("t", "SELECT 1", lambda sql, params=None: new, snapshots.read_meta("t"),
+                                           location="here")
+
+
+def years(values):
+    return pd.array(values, dtype="Int64")
+
+
+def test_newest_first_with_a_missing_year():
+    old = pd.DataFrame({"Fiscal_Year": years([2022, 2021, 2020, None]), "v": [1, 2, 3, 4]})
+    new = pd.DataFrame({"Fiscal_Year": years([2023, 2022]), "v": [9, 8]})
+    df = refresh(old, new)
+    assert list(df["Fiscal_Year"]) == [2023, 2022, 2021, 2020, pd.NA]  # NULL rows kept, new rows on top
+    assert list(df["v"]) == [9, 8, 2, 3, 4]
+
+
+def test_oldest_first():
+    old = pd.DataFrame({"Fiscal_Year": years([2020, 2021, 2022]), "v": [1, 2, 3]})
+    new = pd.DataFrame({"Fiscal_Year": years([2022, 2023]), "v": [8, 9]})
+    assert list(refresh(old, new)["v"]) == [1, 2, 8, 9]
+
+
+def test_keeps_categoricals():
+    old = pd.DataFrame({"Fiscal_Year": years([2020, 2021]), "c": pd.Categorical(["a", "b"])})
+    for new in (pd.DataFrame({"Fiscal_Year": years([2021, 2022]), "c": ["b", "z"]}), old.iloc[:0]):
+        df = refresh(old, new)
+        assert isinstance(df["c"].dtype, pd.CategoricalDtype)
+        assert isinstance(pd.read_parquet(snapshots.snapshot_path("t"))["c"].dtype, pd.CategoricalDtype)
@@ -0,0 +1,84 @@
+"""Month-range windows of the conflict series against filtering the rows by date."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import prepare
+from timeline import ConflictData, MonthlyTotals
+
+WINDOWS = [
+    (None, None),
+    ("2019-03", None),
+    (None, "2020-06"),
+    ("2019-11", "2020-02"),
+    ("2020-05", "2020-05"),
+    ("2015-01", "2016-01"),  # before the first month
+    ("2020-08", "2019-01"),  # start after end
+]
+
+
+def in_window(dates, start, end):
+    months = pd.Series(dates).to_numpy().astype("datetime64[M]")
+    mask = np.ones(len(months), dtype=bool)
+    if start is not None:
+        mask &= months >= np.datetime64(start, "M")
+    if end is not None:
+        mask &= months <= np.datetime64(end, "M")
+    return mask
+
+
+@pytest.fixture(scope="module")
+def daily():
+    rng = np.random.default_rng(0)
+    dates = pd.to_datetime("2019-01-01") + pd.to_timedelta(rng.integers(0, 600, 400), unit="D")
+    counts = rng.integers(0, 50, 400).astype("float64")
+    counts[::17] = np.nan  # counted as zero
+    return pd.DataFrame({"date": dates, "a": counts, "b": rng.integers(0, 5, 400)})
+
+
+@pytest.mark.parametrize("start, end", WINDOWS)
+def test_monthly_totals(daily, start, end):
+    totals = MonthlyTotals(daily, ["a", "b"])
+    rows = daily[in_window(daily["date"], start, end)]
+    assert totals.total("a", start, end) == rows["a"].sum()
+    assert totals.total("b", start, end) == rows["b"].sum()
+
+
+def raw_conflict(seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for source in ["political", "civilian"]:
+        months = pd.period_range("2018-01", "2021-12", freq="M")
+        frame = pd.DataFrame({
+            "source": source,
+            "Year": months.year,
+            "Month": [month.strftime("%B") for month in months],
+        })
+        for column in prepare.CONFLICT_SERIES:
+            frame[column] = rng.integers(0, 100, len(frame))
+        frames.append(frame.sample(frac=1, random_state=seed))  # arrives in any order
+    raw = pd.concat(frames, ignore_index=True)
+    raw.loc[3, "Month"] = None  # no date, dropped
+    return raw
+
+
+@pytest.mark.parametrize("start, end", WINDOWS)
+@pytest.mark.parametrize("source, metric", [("political", "Events"), ("civilian", "Fatalities")])
+def test_series(start, end, source, metric):
+    long = prepare.long_conflict(raw_conflict())
+    data = ConflictData(long)
+    expected = long[(long["source"] == source) & (long["metric"] == metric)]
+    expected = expected[in_window(expected["date"], start, end)]
+    expected = expected.sort_values(["Group", "date"], kind="stable")
+    pd.testing.assert_frame_equal(data.series(source, metric, start, end), expected)
+
+
+@pytest.mark.parametrize("start, end", WINDOWS)
+def test_series_totals(start, end):
+    long = prepare.long_conflict(raw_conflict())
+    data = ConflictData(long)
+    for source in ["political", "civilian"]:
+        rows = long[(long["source"] == source) & in_window(long["date"], start, end)]
+        expected = rows.groupby("Group", observed=False)["Count"].sum()  # zero for a window without months
+        for group in long.loc[long["source"] == source, "Group"].unique():
+            assert data.totals[source].total(str(group), start, end) == expected[group]
@@ -0,0 +1,78 @@
+"""The monthly conflict series, ready for any range of months.
+
+``MonthlyTotals`` sums each column per month once per load and keeps running
+totals, so the total over a window is the difference of two of them, found by
+binary search on the months. Moving a date-range slider never rescans the
+frame, however wide the window is.
+
+``ConflictData`` holds the political and civilian tables as one long frame
+sorted into contiguous chart lines. A chart's rows for a window are found by
+binary search too, and the civilian share of political fatalities compares two
+sets of running totals rather than filtering the other table.
+"""
+import numpy as np
+
+from prepare import dataset_stamp
+
+EMPTY = np.zeros(0, dtype=np.intp)
+
+
+def month_label(month):
+    """``"2023-10"`` for any date in October 2023, the form the range slider's options take."""
+    return str(np.datetime64(month, "M"))
+
+
+class MonthlyTotals:
+    def __init__(self, df, columns, date="date"):
+        monthly = df.groupby(df[date].to_numpy().astype("datetime64[M]"))[columns].sum()  # sorted by month
+        self.months = monthly.index.to_numpy().astype("datetime64[M]")
+        self.labels = [month_label(month) for month in self.months]
+        self.cumulative = {}  # column -> running total with a leading 0, cumulative[i] = sum of the first i months
+        for column in columns:
+            values = monthly[column].to_numpy(na_value=0)
+            self.cumulative[column] = np.concatenate([np.zeros(1, dtype=values.dtype), np.cumsum(values)])
+
+    def bounds(self, start=None, end=None):
+        """Positions ``(lo, hi)`` of the months from ``start`` to ``end``, both included; None is open-ended."""
+        lo = 0 if start is None else int(np.searchsorted(self.months, np.datetime64(start, "M"), side="left"))
+        hi = len(self.months) if end is None else int(np.searchsorted(self.months, np.datetime64(end, "M"), side="right"))
+        return lo, max(lo, hi)
+
+    def total(self, column, start=None, end=None):
+        lo, hi = self.bounds(start, end)
+        cumulative = self.cumulative[column]
+        return cumulative[hi] - cumulative[lo]
+
+
+def month_bounds(dates, start=None, end=None):
+    """Positions ``(lo, hi)`` of the sorted ``dates`` that fall from the month ``start`` through the month ``end``."""
+    lo = 0 if start is None else int(np.searchsorted(dates, np.datetime64(start, "M").astype(dates.dtype), side="left"))
+    hi = len(dates) if end is None else int(np.searchsorted(dates, (np.datetime64(end, "M") + 1).astype(dates.dtype), side="left"))
+    return lo, max(lo, hi)
+
+
+class ConflictData:
+    """Both conflict tables in the long form of prepare.long_conflict, with every chart line located by position
+    and running totals per source."""
+
+    def __init__(self, long):
+        self.long = long
+        self.version, self.fetched_at = dataset_stamp(long)
+        self.dates = long["date"].to_numpy()
+        self.lines = {}  # (source, metric) -> (lo, hi) of each of its lines, in chart order
+        lines = long.groupby(["source", "metric", "Group"], observed=True, sort=False).indices
+        for (source, metric, _), rows in lines.items():
+            self.lines.setdefault((source, metric), []).append((rows[0], rows[-1] + 1))
+        self.totals = {}  # source -> MonthlyTotals of its series, by label
+        for source, rows in long.groupby("source", observed=True).indices.items():
+            monthly = long.take(rows).pivot_table(index="date", columns="Group", values="Count", aggfunc="sum", observed=True)
+            monthly.columns = monthly.columns.astype(str)
+            self.totals[source] = MonthlyTotals(monthly.reset_index(), list(monthly.columns))
+
+    def series(self, source, metric, start=None, end=None):
+        """The ``metric`` lines of ``source`` from the month ``start`` through the month ``end``, one row per point."""
+        positions = [EMPTY]
+        for lo, hi in self.lines.get((source, metric), []):
+            first, last = month_bounds(self.dates[lo:hi], start, end)
+            positions.append(np.arange(lo + first, lo + last))
+        return self.long.take(np.concatenate(positions))